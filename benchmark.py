@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+"""
+Measure the performance of parts of Medusa in isolation, on this machine.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+import msgpack
+
+from lib.medusa import serializer
+from lib.medusa.communicate import Communicate, READ_SIZE
+from lib.snake import profile
+from lib.snake.sync import ClockSync
+
+#------------------------------------------------------------------------------
+
+SNAKE_NAME = "benchmark"
+
+# A status update as a Snake would send it while playing a film.
+STATUS = {
+    "media_id": 1234,
+    "name": "Example Film",
+    "state": "playing",
+    "elapsed": 3021,
+    "total": 7248,
+    "mute": False,
+    "queue": [[1235, "Example Film", 0, u"/Data/Film/Example Film.mkv"]],
+    "audio": [[-1, "Disable"], [1, "Track 1 - [English]"]],
+    "subtitles": [[-1, "Disable"], [3, "Track 1 - [English]"]]
+}
+
+#------------------------------------------------------------------------------
+
+def benchmark_socket(options):
+    """
+    Send status-sized messages from a Head to a Snake over a local socket and
+    report how many the Snake receives per second. Then make requests one at
+    a time and report how long each takes to be answered.
+    """
+
+    finished = multiprocessing.Queue()
+
+    snake = multiprocessing.Process(target=_run_snake,
+                                    args=(options.port,
+                                          options.unix,
+                                          options.messages,
+                                          finished))
+    snake.daemon = True
+    snake.start()
+
+    head = Communicate(proxy=HeadProxy, port=options.port, path=options.unix)
+
+    while SNAKE_NAME not in Communicate.connections:
+        time.sleep(0.1)
+
+    message = {"benchmark": STATUS}
+    start = time.time()
+
+    for _ in xrange(options.messages):
+        head.send([SNAKE_NAME], message)
+
+    end = finished.get(timeout=options.timeout)
+    seconds = end - start
+
+    print "Sent %s messages in %.3f seconds: %.0f messages/second" % (
+        options.messages, seconds, options.messages / seconds)
+
+    start = time.time()
+
+    for _ in xrange(options.requests):
+        head.call({"echo": None}, name=SNAKE_NAME)
+
+    seconds = time.time() - start
+
+    print "Made %s requests in %.3f seconds: %.0f microseconds each" % (
+        options.requests, seconds, seconds / options.requests * 1000000)
+
+    snake.terminate()
+
+def _run_snake(port, path, messages, finished):
+    SnakeProxy.expected = messages
+    SnakeProxy.finished = finished
+
+    Communicate(proxy=SnakeProxy,
+                host="127.0.0.1",
+                port=port,
+                name=SNAKE_NAME,
+                path=path)
+
+    while True:
+        time.sleep(1)
+
+
+class HeadProxy(object):
+
+    def clock(self, message):
+        return time.time()
+
+
+class SnakeProxy(object):
+
+    expected = 0
+    finished = None
+    received = 0
+
+    def benchmark(self, message):
+        SnakeProxy.received += 1
+
+        if SnakeProxy.received == SnakeProxy.expected:
+            SnakeProxy.finished.put(time.time())
+
+    def echo(self, message):
+        return message
+
+#------------------------------------------------------------------------------
+
+def benchmark_sync(options):
+    """
+    Have simulated Snakes, whose clocks are each wrong by up to a few
+    seconds, start playing at the same time as each other. Report how far
+    apart they really started, and how well they estimated their clocks.
+    """
+
+    started = multiprocessing.Queue()
+    snakes = []
+
+    for number in xrange(options.snakes):
+        skew = random.uniform(-options.skew, options.skew)
+
+        snake = multiprocessing.Process(target=_run_sync_snake,
+                                        args=(options.port,
+                                              "%s-%s" % (SNAKE_NAME, number),
+                                              skew,
+                                              started))
+        snake.daemon = True
+        snake.start()
+
+        snakes.append(snake)
+
+    head = Communicate(proxy=HeadProxy, port=options.port)
+
+    while len(Communicate.connections) < options.snakes:
+        time.sleep(0.1)
+
+    spreads = []
+
+    for round_ in xrange(options.rounds):
+        at = time.time() + options.lead
+
+        head.broadcast({"action": ["play_at", [at]]})
+
+        results = [started.get(timeout=options.timeout) for _ in snakes]
+        times = [r[0] for r in results]
+        errors = [abs(r[1]) * 1000 for r in results]
+
+        spreads.append((max(times) - min(times)) * 1000)
+
+        print "Round %s: started within %.2fms, late by up to %.2fms, " \
+              "clock error up to %.2fms" % (round_ + 1,
+                                            spreads[-1],
+                                            (max(times) - at) * 1000,
+                                            max(errors))
+
+    print "Started within %.2fms on average, %.2fms at worst" % (
+        sum(spreads) / len(spreads), max(spreads))
+
+    for snake in snakes:
+        snake.terminate()
+
+def _run_sync_snake(port, name, skew, started):
+    SyncSnakeProxy.skew = skew
+    SyncSnakeProxy.started = started
+
+    communicate = Communicate(proxy=SyncSnakeProxy,
+                              host="127.0.0.1",
+                              port=port,
+                              name=name)
+
+    SyncSnakeProxy.clock = ClockSync(communicate,
+                                     clock=lambda: time.time() + skew)
+
+    while True:
+        time.sleep(1)
+
+
+class SyncSnakeProxy(object):
+    """
+    Act as a Snake would on being told to play at a set time, but only note
+    the real time at which playback would have started.
+    """
+
+    clock = None
+    skew = 0
+    started = None
+
+    def action(self, message):
+        function, arguments = message
+
+        self.clock.measure(lambda offset: self._start_at(arguments[0]))
+
+    def _start_at(self, at):
+        delay = self.clock.to_local(at) - self.clock.clock()
+
+        def start():
+            time.sleep(max(delay, 0))
+
+            # Our clock is ahead of the Head's by skew, so the offset we
+            # measured should have been exactly the opposite.
+            self.started.put((time.time(), self.clock.offset + self.skew))
+
+        threading.Thread(target=start).start()
+
+#------------------------------------------------------------------------------
+
+class QueueItem(object):
+
+    __slots__ = ["media_id", "name", "elapsed", "path"]
+
+    def __init__(self, media_id, name, elapsed, path):
+        self.media_id = media_id
+        self.name = name
+        self.elapsed = elapsed
+        self.path = path
+
+    def encode(self):
+        return [self.media_id, self.name, self.elapsed, self.path]
+
+def benchmark_serializer(options):
+    """
+    Pack status updates and then unpack them as a stream, as they would be
+    received. Compare MessagePack's defaults with our serializer, both as it
+    is and with queue items sent as an extension type.
+    """
+
+    serializer.register(1,
+                        QueueItem,
+                        QueueItem.encode,
+                        lambda value: QueueItem(*value))
+
+    status = dict(STATUS, queue=[QueueItem(*i) for i in STATUS["queue"]])
+
+    candidates = [
+        ("MessagePack defaults", msgpack.Packer().pack, msgpack.Unpacker,
+         STATUS),
+        ("Serializer", serializer.pack, serializer.unpacker,
+         STATUS),
+        ("Serializer with extension type", serializer.pack,
+         serializer.unpacker, status)
+    ]
+
+    for name, pack, unpacker, status in candidates:
+        message = {"update": [SNAKE_NAME, status, 1, 2]}
+
+        start = time.time()
+
+        for _ in xrange(options.messages):
+            data = pack(message)
+
+        packed = time.time() - start
+
+        stream = data * options.messages
+        unpacker = unpacker()
+        received = 0
+
+        start = time.time()
+
+        for offset in xrange(0, len(stream), READ_SIZE):
+            unpacker.feed(stream[offset:offset + READ_SIZE])
+
+            for message in unpacker:
+                received += 1
+
+        unpacked = time.time() - start
+
+        print "%s: %s bytes, packed %.0f/second, unpacked %.0f/second" % (
+            name,
+            len(data),
+            options.messages / packed,
+            received / unpacked)
+
+#------------------------------------------------------------------------------
+
+def benchmark_vlc(options):
+    """
+    Play a sample file with each libVLC profile, timing how long it takes to
+    start playing, and to play from somewhere else once asked to seek.
+    """
+
+    from lib.snake import vlc
+
+    arguments = ["--quiet"]
+
+    if options.headless:
+        arguments.extend(["--vout=dummy", "--aout=dummy"])
+
+    for name in options.profiles or profile.get_names():
+        instance = vlc.Instance(*(arguments +
+                                  profile.get_instance_arguments(name)))
+        media_options = profile.get_media_options(name)
+        starts = []
+        seeks = []
+
+        for round_ in xrange(options.rounds):
+            player = instance.media_player_new()
+            media = instance.media_new(options.file, *media_options)
+
+            player.set_media(media)
+
+            began = time.time()
+
+            player.play()
+
+            if not _wait_for_vlc(player, lambda: True, options.timeout):
+                print "%s: failed to start playing" % name
+
+                break
+
+            starts.append((time.time() - began) * 1000)
+
+            length = player.get_length()
+
+            for seek in xrange(options.seeks if length > 0 else 0):
+                target = random.randint(0, int(length * 0.9))
+
+                began = time.time()
+
+                player.set_time(target)
+
+                # Seeking is done once time carries on from the target.
+                if _wait_for_vlc(player,
+                                 lambda: 0 < player.get_time() - target < 1000,
+                                 options.timeout):
+                    seeks.append((time.time() - began) * 1000)
+
+            player.stop()
+            player.release()
+            media.release()
+
+        instance.release()
+
+        if not starts:
+            continue
+
+        print "%s: started in %.0fms on average, %.0fms at worst" % (
+            name, sum(starts) / len(starts), max(starts))
+
+        if seeks:
+            print "%s: seeked in %.0fms on average, %.0fms at worst" % (
+                name, sum(seeks) / len(seeks), max(seeks))
+
+def _wait_for_vlc(player, condition, timeout):
+    from lib.snake import vlc
+
+    end = time.time() + timeout
+
+    while time.time() < end:
+        state = player.get_state()
+
+        if state in (vlc.State.Ended, vlc.State.Error):
+            return False
+
+        if state == vlc.State.Playing and condition():
+            return True
+
+        time.sleep(0.005)
+
+    return False
+
+#------------------------------------------------------------------------------
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers()
+
+    socket_parser = subparsers.add_parser("socket")
+    socket_parser.set_defaults(function=benchmark_socket)
+    socket_parser.add_argument("-n", "--messages",
+                               action="store", type=int, default=100000)
+    socket_parser.add_argument("-r", "--requests",
+                               action="store", type=int, default=5000)
+    socket_parser.add_argument("-p", "--port",
+                               action="store", type=int, default=18839)
+    socket_parser.add_argument("-t", "--timeout",
+                               action="store", type=int, default=300)
+    socket_parser.add_argument("-u", "--unix",
+                               action="store", default="")
+
+    sync_parser = subparsers.add_parser("sync")
+    sync_parser.set_defaults(function=benchmark_sync)
+    sync_parser.add_argument("-s", "--snakes",
+                             action="store", type=int, default=4)
+    sync_parser.add_argument("-r", "--rounds",
+                             action="store", type=int, default=10)
+    sync_parser.add_argument("-k", "--skew",
+                             action="store", type=float, default=5)
+    sync_parser.add_argument("-l", "--lead",
+                             action="store", type=float, default=1)
+    sync_parser.add_argument("-p", "--port",
+                             action="store", type=int, default=18839)
+    sync_parser.add_argument("-t", "--timeout",
+                             action="store", type=int, default=30)
+
+    serializer_parser = subparsers.add_parser("serializer")
+    serializer_parser.set_defaults(function=benchmark_serializer)
+    serializer_parser.add_argument("-n", "--messages",
+                                   action="store", type=int, default=100000)
+
+    vlc_parser = subparsers.add_parser("vlc")
+    vlc_parser.set_defaults(function=benchmark_vlc)
+    vlc_parser.add_argument("file",
+                            action="store", type=unicode)
+    vlc_parser.add_argument("-P", "--profiles",
+                            action="store", nargs="*")
+    vlc_parser.add_argument("-r", "--rounds",
+                            action="store", type=int, default=5)
+    vlc_parser.add_argument("-s", "--seeks",
+                            action="store", type=int, default=5)
+    vlc_parser.add_argument("-t", "--timeout",
+                            action="store", type=int, default=10)
+    vlc_parser.add_argument("--headless",
+                            action="store_true")
+
+    return parser.parse_args()
+
+#------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    options = parse_arguments()
+    options.function(options)
+
+    # Communication threads never finish by themselves.
+    os._exit(0)
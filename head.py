@@ -51,7 +51,10 @@ if __name__ == "__main__":
     try:
         log.warn("Head initialised")
 
-        app.run(host="0.0.0.0", port=config.getint("ports", "head"))
+        # Status streams hold their request open, so each needs a thread.
+        app.run(host="0.0.0.0",
+                port=config.getint("ports", "head"),
+                threaded=True)
 
     finally:
         log.warn("Head exited")
@@ -44,12 +44,26 @@ def status(snake):
 
     return flask.jsonify(data)
 
+@api.route("/stream/<snake>", methods=["GET"])
+def stream(snake):
+    return flask.Response(support.stream_snake_status(snake),
+                          mimetype="text/event-stream",
+                          headers={"Cache-Control": "no-cache"})
+
 #------------------------------------------------------------------------------
 
 @api.route("/snake/<snake>/<action>", methods=["GET"])
 @api.route("/snake/<snake>/<action>/<value>", methods=["GET"])
-def send(snake, action, value=None):
-    result = support.send_to_snake(snake, action, value)
+@api.route("/snake/<snake>/<action>/<value>/<int:position>", methods=["GET"])
+def send(snake, action, value=None, position=None):
+    result = support.send_to_snake(snake, action, value, position)
+
+    return result
+
+@api.route("/group/<group>/<action>", methods=["GET"])
+@api.route("/group/<group>/<action>/<value>", methods=["GET"])
+def send_group(group, action, value=None):
+    result = support.send_to_group(group, action, value)
 
     return result
 
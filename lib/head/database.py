@@ -7,6 +7,7 @@ Select results will be cached until the cache is expired due to an insert.
 """
 
 from collections import OrderedDict
+import json
 import os
 import sqlite3
 import time
@@ -38,6 +39,9 @@ class Database(object):
         with self.database:
             data = self.database.select_media_by_category(category)
 
+            self._add_thumbnails(data.values(),
+                                 self.database.select_thumbnails())
+
         self._cache[category] = data
 
         log.info("Returning category select from database")
@@ -49,8 +53,12 @@ class Database(object):
 
         data = {}
 
-        for key in self._cache.keys():
-            data = self._cache[key].get(media_id, {})
+        # Clearing replaces the cache, perhaps from another thread, so use
+        # the same one throughout.
+        cache = self._cache
+
+        for key in cache.keys():
+            data = cache[key].get(media_id, {})
 
             if data:
                 break
@@ -58,18 +66,28 @@ class Database(object):
         if data:
             log.info("Returning media select from cache")
 
+            # Category selects leave out probe results, being for listings.
+            if "tracks" not in data:
+                with self.database:
+                    self._add_probes(data)
+
             return data
 
         with self.database:
             data = self.database.select_media_by_id(media_id)
 
+            if data.get(media_id):
+                item = data[media_id]
+
+                self._add_probes(item)
+                self._add_thumbnails(
+                    [item],
+                    self.database.select_thumbnails_by_paths(item["paths"]))
+
         if data.get(media_id):
             category = data[media_id]["category"]
 
-            if not self._cache.get(category):
-                self._cache[category] = {}
-
-            self._cache[category][media_id] = data[media_id]
+            cache.setdefault(category, {})[media_id] = data[media_id]
 
         log.info("Returning media select from database")
 
@@ -83,6 +101,22 @@ class Database(object):
 
         return data
 
+    def select_probes(self):
+        log.info("Perfoming probe select")
+
+        with self.database:
+            data = self.database.select_probes()
+
+        return dict((row["path"], row) for row in data)
+
+    def select_thumbnails(self):
+        log.info("Perfoming thumbnail select")
+
+        with self.database:
+            data = self.database.select_thumbnails()
+
+        return dict((row["path"], row) for row in data)
+
     def select_like_media(self, term):
         log.info("Perfoming search with term: %s", term)
 
@@ -169,6 +203,26 @@ class Database(object):
         if inserted:
             self.clear_cache()
 
+    def insert_probes(self, probes):
+        with self.database:
+            for data in probes:
+                log.info("Inserting probe: %s", data["path"])
+
+                self.database.insert_probe(data)
+
+        if probes:
+            self.clear_cache()
+
+    def insert_thumbnails(self, thumbnails):
+        with self.database:
+            for data in thumbnails:
+                log.info("Inserting thumbnail: %s", data["path"])
+
+                self.database.insert_thumbnail(data)
+
+        if [data for data in thumbnails if data["hash"]]:
+            self.clear_cache()
+
     def insert_viewed(self, media_id):
         log.warn("Inserting viewed media: %s", media_id)
 
@@ -195,6 +249,16 @@ class Database(object):
         if media_ids:
             self.clear_cache()
 
+    def evict_thumbnails(self, hashes):
+        with self.database:
+            for hash_ in hashes:
+                log.info("Evicting thumbnail: %s", hash_)
+
+                self.database.evict_thumbnail_by_hash(hash_)
+
+        if hashes:
+            self.clear_cache()
+
     def delete_viewed(self, media_id):
         log.warn("Deleting viewed: %s", media_id)
 
@@ -203,6 +267,51 @@ class Database(object):
 
     #--------------------------------------------------------------------------
 
+    def _add_probes(self, item):
+        """
+        Add the total duration of the item's files, as far as they have been
+        probed, and the tracks of each file.
+        """
+
+        paths = item["paths"]
+
+        if not isinstance(paths, list):
+            paths = [paths]
+
+        item["duration"] = 0
+        item["tracks"] = {}
+
+        for probe in self.database.select_probes_by_paths(paths):
+            item["duration"] += probe["duration"] or 0
+            item["tracks"][probe["path"]] = {
+                "audio": json.loads(probe["audio"] or "[]"),
+                "subtitles": json.loads(probe["subtitles"] or "[]")
+            }
+
+    def _add_thumbnails(self, items, thumbnails):
+        """
+        Add the name of the thumbnail taken from each item's first file,
+        out of the thumbnail rows given.
+        """
+
+        hashes = dict((row["path"], row["hash"]) for row in thumbnails)
+
+        for item in items:
+            paths = item["paths"]
+
+            if not isinstance(paths, list):
+                paths = [paths]
+
+            item["thumbnail"] = None
+
+            for path in sorted(paths):
+                if hashes.get(path):
+                    item["thumbnail"] = "%s.jpg" % hashes[path]
+
+                    break
+
+    #--------------------------------------------------------------------------
+
     @classmethod
     def clear_cache(cls, category=None, media_id=None):
         if media_id:
@@ -229,6 +338,8 @@ class Database(object):
 
 class DatabaseConnection(object):
 
+    _upgraded = False
+
     def __init__(self):
         self.database = os.path.join(config.base_path,
                                      config.get("files", "database"))
@@ -236,6 +347,11 @@ class DatabaseConnection(object):
         if not os.path.exists(self.database):
             self.create_database()
 
+        elif not DatabaseConnection._upgraded:
+            self.upgrade_database()
+
+        DatabaseConnection._upgraded = True
+
     def __enter__(self):
         self._open_connection()
 
@@ -318,10 +434,45 @@ class DatabaseConnection(object):
                                 elapsed INTEGER)
                             """)
 
+        self._create_probe_table()
+        self._create_thumbnail_table()
         self._close_connection()
 
         log.warn("Created database")
 
+    def upgrade_database(self):
+        """
+        Add any tables missing from a database created by an older version.
+        """
+
+        self._open_connection()
+        self._create_probe_table()
+        self._create_thumbnail_table()
+        self._close_connection()
+
+    def _create_probe_table(self):
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS
+                               probe
+                               (path TEXT PRIMARY KEY,
+                                modified INTEGER,
+                                size INTEGER,
+                                duration INTEGER,
+                                width INTEGER,
+                                height INTEGER,
+                                codec TEXT,
+                                audio TEXT,
+                                subtitles TEXT)
+                            """)
+
+    def _create_thumbnail_table(self):
+        self.cursor.execute("""CREATE TABLE IF NOT EXISTS
+                               thumbnail
+                               (path TEXT PRIMARY KEY,
+                                modified INTEGER,
+                                size INTEGER,
+                                hash TEXT)
+                            """)
+
     #--------------------------------------------------------------------------
 
     def select_media(self):
@@ -448,6 +599,42 @@ class DatabaseConnection(object):
 
         return self.cursor.fetchall()
 
+    def select_probes(self):
+        self.cursor.execute("""SELECT path,
+                               modified,
+                               size,
+                               duration
+                               FROM probe
+                            """)
+
+        return self.cursor.fetchall()
+
+    def select_probes_by_paths(self, paths):
+        self.cursor.execute("""SELECT *
+                               FROM probe
+                               WHERE path IN (%s)
+                            """ % ", ".join("?" * len(paths)),
+                            [self._sanitise(p) for p in paths])
+
+        return self.cursor.fetchall()
+
+    def select_thumbnails(self):
+        self.cursor.execute("""SELECT *
+                               FROM thumbnail
+                            """)
+
+        return self.cursor.fetchall()
+
+    def select_thumbnails_by_paths(self, paths):
+        self.cursor.execute("""SELECT *
+                               FROM thumbnail
+                               WHERE path IN (%s)
+                               ORDER BY path ASC
+                            """ % ", ".join("?" * len(paths)),
+                            [self._sanitise(p) for p in paths])
+
+        return self.cursor.fetchall()
+
     #--------------------------------------------------------------------------
 
     def insert_media(self, data):
@@ -486,6 +673,40 @@ class DatabaseConnection(object):
                                   extension,
                                   modified))
 
+    def insert_probe(self, data):
+        self.cursor.execute("""INSERT OR REPLACE INTO probe
+                               (path,
+                                modified,
+                                size,
+                                duration,
+                                width,
+                                height,
+                                codec,
+                                audio,
+                                subtitles)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """, (self._sanitise(data["path"]),
+                                  data["modified"],
+                                  data["size"],
+                                  data["duration"],
+                                  data["width"],
+                                  data["height"],
+                                  data["codec"],
+                                  json.dumps(data["audio"]),
+                                  json.dumps(data["subtitles"])))
+
+    def insert_thumbnail(self, data):
+        self.cursor.execute("""INSERT OR REPLACE INTO thumbnail
+                               (path,
+                                modified,
+                                size,
+                                hash)
+                               VALUES (?, ?, ?, ?)
+                            """, (self._sanitise(data["path"]),
+                                  data["modified"],
+                                  data["size"],
+                                  data["hash"]))
+
     def insert_viewed(self, media_id):
         media_id = media_id
         viewed = int(time.time())
@@ -526,3 +747,11 @@ class DatabaseConnection(object):
         self.cursor.execute("""DELETE FROM media
                                WHERE id = ?
                             """, (media_id,))
+
+    def evict_thumbnail_by_hash(self, hash_):
+        # Keeping the row, without a hash, stops the file being taken again
+        # until it changes.
+        self.cursor.execute("""UPDATE thumbnail
+                               SET hash = NULL
+                               WHERE hash = ?
+                            """, (hash_,))
@@ -12,6 +12,8 @@ import threading
 import time
 
 from lib.head.database import Database
+from lib.head.probe import Prober
+from lib.head.thumbnail import Thumbnailer
 from lib.medusa import categories
 from lib.medusa import utilities
 from lib.medusa.config import config
@@ -110,6 +112,8 @@ class IndexThread(threading.Thread):
 
         self.insert_new_media(media)
         self.delete_missing_media()
+        self.probe_media()
+        self.thumbnail_media()
 
         self.now = False
         self.stop = False
@@ -222,8 +226,61 @@ class IndexThread(threading.Thread):
 
         self.database.delete_media(to_delete)
 
+    def probe_media(self):
+        """
+        Probe the playable files of every item for their duration and tracks.
+        """
+
+        files = {}
+
+        for item in self.database.select_all_media():
+            files.update(self._get_playable_files(item))
+
+        probes = Prober().probe(files, self.database.select_probes())
+
+        self.database.insert_probes(probes)
+
+    def thumbnail_media(self):
+        """
+        Have thumbnails taken from the first file of each item in the
+        configured categories, which happens in the background.
+        """
+
+        files = {}
+        categories = config.getlist("thumbnails", "categories")
+
+        for item in self.database.select_all_media():
+            if item["category"] not in categories:
+                continue
+
+            playable = self._get_playable_files(item)
+
+            if playable:
+                path = min(playable)
+                files[path] = playable[path]
+
+        Thumbnailer().update(files)
+
     #--------------------------------------------------------------------------
 
+    def _get_playable_files(self, item):
+        files = {}
+        formats = (config.getlist("index", "audio_formats") +
+                   config.getlist("index", "video_formats"))
+        base_path = os.path.dirname(self.naming[item["category"]]["path"])
+        paths = item["paths"]
+
+        if not isinstance(paths, list):
+            paths = [paths]
+
+        for path in paths:
+            extension = os.path.splitext(path)[-1].replace(".", "", 1)
+
+            if extension in formats:
+                files[path] = os.path.join(base_path, path)
+
+        return files
+
     def _get_naming(self):
         naming_path = os.path.join(config.base_path,
                                    config.get("files", "naming"))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Probe media files with libVLC for their duration and tracks, without having
+to play them.
+"""
+
+import ctypes
+from multiprocessing.pool import ThreadPool
+import os
+import struct
+import time
+
+try:
+    from lib.snake import vlc
+
+except (ImportError, OSError, NotImplementedError):
+    vlc = None
+
+from lib.medusa import utilities
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class Prober(object):
+    """
+    Files are parsed in parallel by a pool of workers, sharing one headless
+    libVLC instance. A file that has been probed before is only probed again
+    if its modification time or size has changed.
+
+    There is one Prober per process, so that its libVLC instance is created
+    once rather than on every index. Its workers only live for each probe.
+
+    Parsing is given a time limit, so that a file which can't be read, such
+    as one on a stalled network mount, doesn't hold up the whole index. It is
+    probed again on the next index.
+    """
+
+    __metaclass__ = utilities.Singleton
+
+    def __init__(self):
+        self.workers = config.getint("index", "probe_workers")
+        self.timeout = config.getint("index", "probe_timeout")
+        self.instance = None
+
+        # The bindings import without libVLC, failing only once used.
+        try:
+            self.instance = vlc.Instance("--quiet", "--no-video", "--no-audio")
+
+        except Exception:
+            pass
+
+        if not self.instance:
+            log.error("libVLC unavailable, media will not be probed")
+
+    def probe(self, files, known):
+        """
+        Probe files given as a dictionary of their paths as stored against
+        media, to their full paths. Known results are given in the same way,
+        and are returned again unless out of date.
+        """
+
+        if not self.instance:
+            return []
+
+        pending = []
+
+        for path, full_path in files.items():
+            try:
+                stat = os.stat(full_path)
+
+            except OSError:
+                continue
+
+            result = known.get(path)
+
+            if (result and result["modified"] == int(stat.st_mtime)
+                       and result["size"] == stat.st_size):
+                continue
+
+            pending.append((path, full_path, int(stat.st_mtime), stat.st_size))
+
+        if not pending:
+            return []
+
+        log.warn("Probing %s media files", len(pending))
+
+        pool = ThreadPool(self.workers)
+
+        try:
+            results = pool.map(self._probe, pending)
+
+        finally:
+            pool.close()
+            pool.join()
+
+        return [r for r in results if r]
+
+    #--------------------------------------------------------------------------
+
+    def _probe(self, arguments):
+        path, full_path, modified, size = arguments
+
+        result = {
+            "path": path,
+            "modified": modified,
+            "size": size,
+            "duration": None,
+            "width": None,
+            "height": None,
+            "codec": None,
+            "audio": [],
+            "subtitles": []
+        }
+
+        media = None
+
+        try:
+            media = self.instance.media_new(full_path)
+
+            if not self._parse(media):
+                log.error("Timed out probing %s", full_path)
+
+                return
+
+            duration = media.get_duration()
+
+            if duration > 0:
+                result["duration"] = duration / 1000
+
+            for track in self._get_tracks(media):
+                if track["type"] == vlc.TrackType.video:
+                    result["width"] = track["width"]
+                    result["height"] = track["height"]
+                    result["codec"] = track["codec"]
+
+                elif track["type"] == vlc.TrackType.audio:
+                    result["audio"].append([track["id"],
+                                            track["language"],
+                                            track["description"]])
+
+                elif track["type"] == vlc.TrackType.text:
+                    result["subtitles"].append([track["id"],
+                                                track["language"],
+                                                track["description"]])
+
+        except Exception as excp:
+            log.error("Failed to probe %s: %s", full_path, excp)
+
+            return
+
+        finally:
+            if media:
+                media.release()
+
+        return result
+
+    def _parse(self, media):
+        """
+        Parse the media, returning whether that finished within the timeout.
+        These bindings' synchronous parse has no timeout of its own, so parse
+        asynchronously and wait for it here.
+        """
+
+        media.parse_async()
+
+        end = time.time() + self.timeout
+
+        while time.time() < end:
+            if media.is_parsed():
+                return True
+
+            time.sleep(0.1)
+
+        return False
+
+    def _get_tracks(self, media):
+        """
+        Get the details of the media's tracks, which libVLC only lends us.
+        """
+
+        pointer = ctypes.POINTER(vlc.MediaTrack)()
+        count = vlc.libvlc_media_tracks_get(media, ctypes.byref(pointer))
+
+        if not count:
+            return []
+
+        # What we are given is really an array of pointers to tracks.
+        array = ctypes.POINTER(ctypes.POINTER(vlc.MediaTrack) * count)
+        tracks = []
+
+        try:
+            for track in ctypes.cast(pointer, array).contents:
+                track = track.contents
+
+                details = {
+                    "type": track.type,
+                    "id": track.id,
+                    "codec": self._get_fourcc(track.codec),
+                    "language": track.language or "",
+                    "description": track.description or ""
+                }
+
+                if track.type == vlc.TrackType.video:
+                    details["width"] = track.video.contents.width
+                    details["height"] = track.video.contents.height
+
+                tracks.append(details)
+
+        finally:
+            vlc.libvlc_media_tracks_release(pointer, count)
+
+        return tracks
+
+    def _get_fourcc(self, codec):
+        return struct.pack("<I", codec).strip("\x00 ")
@@ -4,13 +4,70 @@
 Proxy function calls exposed to Snakes during communication.
 """
 
+import time
+
+from lib.head.database import Database
+from lib.head.stream import StatusStream
+from lib.medusa.communicate import Communicate
+from lib.medusa.log import log
+
 #------------------------------------------------------------------------------
 
 class Proxy(object):
 
     _snakes = {}
 
+    def clock(self, message):
+        return time.time()
+
+    def disconnected(self, snake):
+        log.warn("Forgetting status of %s", snake)
+
+        self._snakes.pop(snake, None)
+
+    def media(self, media_id):
+        return Database().select_media(int(media_id)) or {}
+
+    def viewed(self, message):
+        # Imported here, as support itself depends on this module.
+        from lib.head import support
+
+        media_id, delete = message
+
+        support.update_viewed(media_id, delete=delete)
+
+    def elapsed(self, message):
+        from lib.head import support
+
+        media_id, elapsed = message
+
+        support.update_viewed(media_id, elapsed=elapsed)
+
     def update(self, message):
-        snake, status = message
+        """
+        Merge the changed status fields sent by a Snake. An update that does
+        not follow on from the version we hold means that we missed one, so
+        ask the Snake for its full status instead.
+        """
+
+        snake, changes, since, version = message
+
+        # Work on a copy, as the web interface may be reading the original.
+        status = dict(self._snakes.get(snake, {}))
+
+        if since and since != status.get("version"):
+            log.warn("Status from %s out of sequence, resynchronising", snake)
+
+            Communicate().send([snake], {"action": ["resync", []]})
+
+            return
+
+        if not since:
+            status = {}
+
+        status.update(changes)
+        status["version"] = version
 
         self._snakes[snake] = status
+
+        StatusStream.publish(snake, changes)
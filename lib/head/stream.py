@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Push Snake status changes to web interface clients.
+
+Each client keeps its own set of pending changes, which are merged together
+until the client is ready for them. A slow client therefore only ever receives
+the latest values rather than a backlog of updates.
+"""
+
+import threading
+
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class StatusStream(object):
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, snake):
+        client = StatusClient()
+
+        with cls._lock:
+            cls._clients.setdefault(snake, set()).add(client)
+
+        log.info("Status stream subscribed to %s", snake)
+
+        return client
+
+    @classmethod
+    def unsubscribe(cls, snake, client):
+        with cls._lock:
+            clients = cls._clients.get(snake, set())
+            clients.discard(client)
+
+            if not clients:
+                cls._clients.pop(snake, None)
+
+        log.info("Status stream unsubscribed from %s", snake)
+
+    @classmethod
+    def publish(cls, snake, changes):
+        """
+        Hand the changed status fields of a Snake to each of its clients.
+        """
+
+        if not changes:
+            return
+
+        with cls._lock:
+            clients = list(cls._clients.get(snake, []))
+
+        for client in clients:
+            client.push(changes)
+
+
+class StatusClient(object):
+
+    def __init__(self):
+        self.pending = {}
+        self.condition = threading.Condition()
+
+    def push(self, changes):
+        with self.condition:
+            self.pending.update(changes)
+            self.condition.notify()
+
+    def pull(self, timeout):
+        """
+        Wait for changes and return everything that has accumulated, or an
+        empty dictionary if nothing arrived before the timeout.
+        """
+
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+
+            changes, self.pending = self.pending, {}
+
+        return changes
@@ -4,9 +4,13 @@
 Various functions used to support the API.
 """
 
+import json
+import time
+
 from lib.head.database import Database
 from lib.head.index import Index
 from lib.head.proxy import Proxy
+from lib.head.stream import StatusStream
 from lib.medusa import categories
 from lib.medusa.communicate import Communicate
 from lib.medusa.config import config
@@ -24,42 +28,111 @@ def search_media(term):
 
 def get_snakes(queue):
     data = {}
+    snakes = []
 
     try:
-        snakes = Communicate.connections
+        snakes = Communicate.connections.keys()
 
     except Exception as excp:
         log.error("Failed to get Snakes: %s", excp)
 
     if queue:
-        for snake in snakes.keys():
-            if not Proxy._snakes[snake].get("media_id"):
-                snakes.pop(snake, None)
+        snakes = [s for s in snakes if get_snake_status(s).get("media_id")]
 
-    data["snakes"] = snakes.keys()
+    data["snakes"] = snakes
+    data["groups"] = get_groups()
+    data["rtt"] = get_round_trips()
 
     return data
 
+def get_groups():
+    if not config.has_section("groups"):
+        return []
+
+    return config.options("groups")
+
+def get_group(group):
+    """
+    Get the names of the Snakes in a configured group. The group "all" is
+    every connected Snake.
+    """
+
+    if group == "all":
+        return Communicate.connections.keys()
+
+    if config.has_option("groups", group):
+        return config.getlist("groups", group)
+
+    return []
+
+def get_round_trips():
+    """
+    Get the round trip time to each Snake in milliseconds, or None if it has
+    not been measured yet.
+    """
+
+    round_trips = {}
+
+    try:
+        for snake, rtt in Communicate().round_trips().items():
+            round_trips[snake] = round(rtt * 1000, 1) if rtt else None
+
+    except Exception as excp:
+        log.error("Failed to get round trips: %s", excp)
+
+    return round_trips
+
 def get_snake_status(snake):
     return Proxy._snakes.get(snake, {})
 
-def send_to_snake(snake, action, value=None):
-    if action in ["play", "stop"]:
-        send_to_snake(snake, "empty_queue")
+def stream_snake_status(snake):
+    """
+    Yield Server-Sent Events for a Snake, starting with its full status and
+    followed by only the fields that change.
+    """
 
-    arguments = [action]
+    keepalive = config.getint("head", "stream_keepalive")
+    client = StatusStream.subscribe(snake)
 
-    if value:
-        arguments.append([value])
+    try:
+        yield _format_event(get_snake_status(snake))
+
+        while True:
+            changes = client.pull(keepalive)
+
+            if changes:
+                yield _format_event(changes)
+
+            else:
+                # Writing a comment lets us notice clients that have gone.
+                yield ": keepalive\n\n"
 
-    else:
-        arguments.append([])
+    finally:
+        StatusStream.unsubscribe(snake, client)
+
+def _format_event(data):
+    return "data: %s\n\n" % json.dumps(data)
+
+def send_to_snake(snake, action, value=None, position=None):
+    """
+    Send an action to a Snake. Actions on queued items, such as inserting or
+    moving one, also take a position in the queue.
+    """
+
+    if action in ["play", "stop"]:
+        send_to_snake(snake, "empty_queue")
 
     try:
-        Communicate().send([snake], {"action": arguments})
+        message = _build_action(action, value)
+
+        if position is not None:
+            message[1].append(position)
+
+        # Wait for the Snake to confirm that the action was performed.
+        Communicate().call({"action": message}, name=snake)
 
         if action == "play":
-            categories.queue_tracks(snake, value)
+            categories.queue_tracks([snake], value)
 
         return "0"
 
@@ -68,6 +141,64 @@ def send_to_snake(snake, action, value=None):
 
         return "1"
 
+def send_to_group(group, action, value=None):
+    """
+    Send an action to every Snake in a group at once. Unlike sending to a
+    single Snake we don't wait for confirmation, so that the Snakes all
+    receive the action as close together as possible.
+
+    Playback is started at a set time a little way ahead, which each Snake
+    converts to its own clock, so that they all start together regardless of
+    how quickly the action reached them.
+    """
+
+    snakes = get_group(group)
+
+    if not snakes:
+        log.error("No Snakes in group: %s", group)
+
+        return "1"
+
+    communicate = Communicate()
+
+    try:
+        if action in ["play", "stop"]:
+            communicate.broadcast({"action": ["empty_queue", []]}, snakes)
+
+        message = _build_action(action, value)
+
+        if action == "play":
+            at = time.time() + config.getfloat("sync", "lead")
+            message = ["play_at", [at] + message[1]]
+
+        sent = communicate.broadcast({"action": message}, snakes)
+
+        if action == "play":
+            categories.queue_tracks(snakes, value)
+
+        return "0" if sent else "1"
+
+    except Exception as excp:
+        log.error("%s on group %s failed: %s", action.title(), group, excp)
+
+        return "1"
+
+def _build_action(action, value):
+    arguments = []
+
+    if value:
+        argument = value
+
+        # Send the details needed to play a media item along with the action,
+        # rather than have the Snake look them up before it can start.
+        #
+        if action in ["play", "queue", "insert"] and str(value).isdigit():
+            argument = dict(get_media(int(value)), id=int(value))
+
+        arguments.append(argument)
+
+    return [action, arguments]
+
 #------------------------------------------------------------------------------
 
 def update_viewed(media_id, elapsed=None, delete=False):
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+Take a frame from films and episodes to show as their thumbnail, and keep
+the results in a cache on disk.
+"""
+
+import hashlib
+import os
+import Queue
+import threading
+import time
+
+try:
+    from lib.snake import vlc
+
+except (ImportError, OSError, NotImplementedError):
+    vlc = None
+
+from lib.head.database import Database
+from lib.medusa import utilities
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+# How many thumbnails are taken before they're stored, each store clearing
+# the media cache.
+BATCH_SIZE = 20
+
+#------------------------------------------------------------------------------
+
+class Thumbnailer(object):
+    """
+    Frames are taken one file at a time by a thread of their own, so that
+    neither indexing nor requests wait on them. Each is played by a headless
+    libVLC player from part way in, and snapshot at the configured width.
+
+    Thumbnails are named by a hash of their contents, so they can be cached
+    by browsers indefinitely. Once the cache grows beyond its size, the
+    least recently written thumbnails are removed, and are only taken again
+    if their files change, so that a cache smaller than the library doesn't
+    take the same frames over and over.
+    """
+
+    __metaclass__ = utilities.Singleton
+
+    def __init__(self):
+        self.path = os.path.join(config.base_path,
+                                 config.get("files", "thumbnails"))
+        self.width = config.getint("thumbnails", "width")
+        self.position = config.getfloat("thumbnails", "position")
+        self.timeout = config.getint("thumbnails", "timeout")
+        self.cache_size = config.getint("thumbnails", "cache_size") * 2 ** 20
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self.database = Database()
+        self.instance = None
+        self._queue = Queue.Queue()
+
+        try:
+            self.instance = vlc.Instance("--quiet",
+                                         "--intf=dummy",
+                                         "--vout=dummy",
+                                         "--no-audio",
+                                         "--no-snapshot-preview",
+                                         "--snapshot-format=jpg")
+
+        except Exception:
+            pass
+
+        if not self.instance:
+            log.error("libVLC unavailable, thumbnails will not be taken")
+
+            return
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def update(self, files):
+        """
+        Take thumbnails for files given as a dictionary of their paths as
+        stored against media, to their full paths, where they are missing
+        or out of date.
+        """
+
+        if self.instance:
+            self._queue.put(files)
+
+    def get_path(self, name):
+        """
+        Get the path of a cached thumbnail, or None if it isn't there.
+        """
+
+        path = os.path.join(self.path, os.path.basename(name))
+
+        if os.path.isfile(path):
+            return path
+
+    #--------------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            files = self._queue.get()
+
+            # Only the latest set of files matters.
+            while not self._queue.empty():
+                files = self._queue.get()
+
+            try:
+                self._update(files)
+
+            except Exception as excp:
+                log.error("Failed to update thumbnails: %s", excp)
+
+    def _update(self, files):
+        known = self.database.select_thumbnails()
+        durations = self.database.select_probes()
+        taken = []
+
+        for path, full_path in sorted(files.items()):
+            try:
+                stat = os.stat(full_path)
+
+            except OSError:
+                continue
+
+            result = known.get(path)
+
+            if (result and result["modified"] == int(stat.st_mtime)
+                       and result["size"] == stat.st_size
+                       and (not result["hash"] or
+                            self.get_path("%s.jpg" % result["hash"]))):
+                continue
+
+            duration = (durations.get(path) or {}).get("duration")
+
+            taken.append({
+                "path": path,
+                "modified": int(stat.st_mtime),
+                "size": stat.st_size,
+                "hash": self._take(full_path, duration)
+            })
+
+            if len(taken) >= BATCH_SIZE:
+                self.database.insert_thumbnails(taken)
+                taken = []
+
+        self.database.insert_thumbnails(taken)
+        self.database.evict_thumbnails(self._evict())
+
+    def _take(self, full_path, duration):
+        """
+        Snapshot a frame of the file into the cache, returning its hash.
+        """
+
+        temporary = os.path.join(self.path, "snapshot.tmp.jpg")
+        options = []
+
+        if duration:
+            options.append(":start-time=%s" % int(duration * self.position))
+
+        player = self.instance.media_player_new()
+        media = self.instance.media_new(full_path, *options)
+
+        player.set_media(media)
+        player.play()
+
+        try:
+            if not self._wait(player):
+                log.error("No frame to take from %s", full_path)
+
+                return
+
+            # Let the first frames after starting or seeking settle.
+            time.sleep(0.5)
+
+            if player.video_take_snapshot(0, temporary, self.width, 0) != 0:
+                log.error("Failed to take a frame from %s", full_path)
+
+                return
+
+        finally:
+            player.stop()
+            player.release()
+            media.release()
+
+        try:
+            with open(temporary, "rb") as file_:
+                data = file_.read()
+
+            hash_ = hashlib.sha1(data).hexdigest()
+
+            os.rename(temporary, os.path.join(self.path, "%s.jpg" % hash_))
+
+        except (IOError, OSError) as excp:
+            log.error("Failed to cache thumbnail of %s: %s", full_path, excp)
+
+            return
+
+        log.info("Took thumbnail of %s: %s", full_path, hash_)
+
+        return hash_
+
+    def _wait(self, player):
+        end = time.time() + self.timeout
+
+        while time.time() < end:
+            state = player.get_state()
+
+            if state in (vlc.State.Ended, vlc.State.Error):
+                return False
+
+            if state == vlc.State.Playing and player.has_vout():
+                return True
+
+            time.sleep(0.1)
+
+        return False
+
+    def _evict(self):
+        """
+        Remove the oldest thumbnails beyond the cache's size, returning the
+        hashes of those removed.
+        """
+
+        thumbnails = []
+        total = 0
+
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+
+            try:
+                stat = os.stat(path)
+
+            except OSError:
+                continue
+
+            thumbnails.append((stat.st_mtime, stat.st_size, name, path))
+            total += stat.st_size
+
+        removed = []
+
+        for modified, size, name, path in sorted(thumbnails):
+            if total <= self.cache_size:
+                break
+
+            try:
+                os.remove(path)
+
+            except OSError:
+                continue
+
+            total -= size
+            removed.append(os.path.splitext(name)[0])
+
+        if removed:
+            log.warn("Evicted %s thumbnails from the cache", len(removed))
+
+        return removed
@@ -85,27 +85,28 @@ def parse_music(matches):
 
 #------------------------------------------------------------------------------
 
-def queue_tracks(snake, value):
+def queue_tracks(snakes, value):
     """
-    Queue up the remaining tracks of an album.
+    Queue up the remaining tracks of an album, sending them all along with
+    their details in a single message.
     """
 
     # If we get no tracks, this probably wasn't an album.
     tracks = Database().select_next_tracks(value)
+    items = []
+    queue_up = False
 
-    if tracks:
-        queue_up = False
+    for track in tracks:
+        if not queue_up:
+            # Don't begin queuing until we have passed the user selected
+            # track.
+            #
+            if track["id"] == int(value):
+                queue_up = True
 
-        for track in tracks:
-            track_id = track["id"]
+            continue
 
-            if not queue_up:
-                # Don't begin queuing until we have passed the user selected
-                # track.
-                #
-                if track_id == int(value):
-                    queue_up = True
+        items.append(track)
 
-                continue
-
-            Communicate().send([snake], {"action": ["queue", [track_id]]})
+    if items:
+        Communicate().send(snakes, {"action": ["queue_many", [items]]})
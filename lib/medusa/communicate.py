@@ -2,28 +2,79 @@
 
 """
 Communicate asynchronously over sockets as either a client or a server while
-using MessagePack for serialization.
+using MessagePack for serialization. Incoming data is read straight into a
+buffer that MessagePack unpacks from, rather than into a new string per read.
 
 Trigger remote method calls on both ends through the provided proxy object.
-
-Both ends of the communication will automatically reconnect in the event of
-a disconnection.
+Calls are either fire-and-forget, or requests whose result comes back in a
+response carrying the same request ID and is delivered through a Future.
+
+Clients automatically reconnect, backing off exponentially, in the event of
+a disconnection. The server pings each client periodically, so that either
+end notices a peer which has silently gone away and drops its connection.
+Where the server and client share a machine, they can talk over a Unix domain
+socket rather than TCP.
+
+A client may connect under several names, with a proxy for each, as a host of
+several Snakes does. The server then routes each message it sends to the named
+proxy, so that they share one connection.
+
+Everything runs on a single asyncore loop per process, which sleeps until
+there is socket activity, a timer is due, or another thread has queued
+something to send.
 """
 
 import asyncore
+import collections
+import errno
+import heapq
+import itertools
+import os
 import socket
+import stat
+import sys
 import threading
 import time
 
+try:
+    import fcntl
+
+except ImportError:
+    fcntl = None
+
 from PyQt4 import QtCore
 import msgpack
 
+from lib.medusa import serializer
 from lib.medusa import utilities
 from lib.medusa.config import config
 from lib.medusa.log import log
 
 #------------------------------------------------------------------------------
 
+# Read as much as is available at once, but refuse to buffer more than a sane
+# amount of a single incomplete message.
+READ_SIZE = 65536
+MAX_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Refuse to queue more outgoing data than this for a peer that is not keeping
+# up with us.
+MAX_QUEUE_SIZE = 4 * 1024 * 1024
+
+# Small queued messages are joined into writes of up to this size.
+BATCH_SIZE = 65536
+
+# Seconds to wait before reconnecting, doubling on each failed attempt.
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 30
+
+#------------------------------------------------------------------------------
+
+class CommunicationError(Exception):
+    pass
+
+#------------------------------------------------------------------------------
+
 class Communicate(object):
     """
     Determine if we are to be a client or a server, and then start an
@@ -32,12 +83,21 @@ class Communicate(object):
 
     __metaclass__ = utilities.Singleton
 
-    def __init__(self, proxy, host=None, port=None, name=None, qthread=False):
+    def __init__(self, proxy, host=None, port=None, name=None, qthread=False,
+                 path=None):
         self.proxy = proxy
         self.host = host or "0.0.0.0"
         self.port = port or config.getint("ports", "socket")
         self.name = name or ""
 
+        # A server listens on this Unix socket as well as on TCP, while a
+        # client connects through it instead of TCP.
+        #
+        if path is None:
+            path = config.get("socket", "unix_path")
+
+        self.path = path
+
         # Determine if we should run as a client or a server.
         #
         if self.name:
@@ -64,7 +124,8 @@ class Communicate(object):
                            self.proxy,
                            self.host,
                            self.port,
-                           self.name)
+                           self.name,
+                           self.path)
 
         self.thread.start()
 
@@ -76,19 +137,74 @@ class Communicate(object):
         """
 
         if self.client:
-            result = self.thread._send_client(args[0])
+            return self.thread._send_client(args[0])
+
+        else:
+            return self.thread._send_server(args[0], args[1])
+
+    def broadcast(self, message, names=None):
+        """
+        Send a message to several connections at once, or to all of them if
+        no names are given.
+        """
+
+        if names is None:
+            names = Communicate.connections.keys()
 
-            # If the message fails to send, restart the client connection.
-            #
-            if not result:
-                log.warn("Relaunching communication thread")
+        return self.thread._send_server(names, message)
 
-                self._start()
+    def round_trips(self):
+        """
+        Get the last measured round trip time, in seconds, of each connection.
+        """
+
+        return dict((name, connection.heartbeat.rtt)
+                    for name, connection in Communicate.connections.items())
+
+    def request(self, message, name=None, timeout=None):
+        """
+        Send a remote method call whose result is wanted, and return a Future
+        for that result. A server must name the connection to send to. If no
+        response arrives in time, the Future fails.
+        """
 
-            return result
+        timeout = timeout or config.getint("socket", "request_timeout")
+
+        future = Future.register()
+        self.thread.loop.call_later(timeout, future.expire)
+
+        method = message.keys()[0]
+        request = {"request": [future.request_id, method, message[method]]}
+
+        if self.client:
+            sent = self.thread._send_client(request)
 
         else:
-            return self.thread._send_server(args[0], args[1])
+            sent = self.thread._send_server([name], request)
+
+        if not sent:
+            future.cancel()
+            future.set_result(None, "Failed to send request")
+
+        return future
+
+    def call(self, message, name=None, timeout=None):
+        """
+        Make a remote method call and wait for its result. A failure on the
+        other end, or no response in time, raises a CommunicationError.
+        """
+
+        # Nothing could read the response while we wait on its only reader.
+        if self.thread.loop.is_current():
+            raise CommunicationError("Cannot wait on the communication thread")
+
+        timeout = timeout or config.getint("socket", "request_timeout")
+
+        # The request expires by itself after its timeout, but that relies on
+        # the communication thread. Should it have died, give up a little
+        # later rather than waiting forever.
+        #
+        return self.request(message, name, timeout).result(timeout + 1)
 
 #------------------------------------------------------------------------------
 
@@ -97,14 +213,19 @@ class CommunicationThread(threading.Thread):
     Launch either a client or a server socket communication interface.
     """
 
-    def __init__(self, client, proxy, host, port, name):
+    def __init__(self, client, proxy, host, port, name, path):
         super(CommunicationThread, self).__init__()
 
         log.info("CommunicationThread initialised")
 
-        self.handler = CommunicationHandler(client, proxy, host, port, name)
-        CommunicationThread.packer = self.handler.packer
+        self.handler = CommunicationHandler(client,
+                                            proxy,
+                                            host,
+                                            port,
+                                            name,
+                                            path)
         self.run = self.handler.run
+        self.loop = self.handler.loop
         self._send_client = self.handler._send_client
         self._send_server = self.handler._send_server
 
@@ -115,7 +236,7 @@ class CommunicationQThread(QtCore.QThread):
     a GUI.
     """
 
-    def __init__(self, client, proxy, host, port, name):
+    def __init__(self, client, proxy, host, port, name, path):
         super(CommunicationQThread, self).__init__()
 
         log.info("CommunicationQThread initialised")
@@ -125,9 +246,9 @@ class CommunicationQThread(QtCore.QThread):
                                             host,
                                             port,
                                             name,
-                                            qthread=True)
-        CommunicationQThread.packer = self.handler.packer
+                                            path)
         self.run = self.handler.run
+        self.loop = self.handler.loop
         self._send_client = self.handler._send_client
         self._send_server = self.handler._send_server
 
@@ -138,51 +259,78 @@ class CommunicationHandler(object):
     Handle communication for a server or client communication thread.
     """
 
-    packer = msgpack.Packer()
-
-    def __init__(self, client, proxy, host, port, name, qthread=False):
+    def __init__(self, client, proxy, host, port, name, path):
         self.client = client
         self.proxy = proxy
         self.host = host
         self.port = port
         self.name = name
-        self.qthread = qthread
+        self.path = path
+        self.loop = CommunicationLoop()
 
     def run(self):
         # Open a client connection.
         #
         if self.client:
+            address = self.path or (self.host, self.port)
+
             self.connection = CommunicationClient(self.proxy,
-                                                  self.host,
-                                                  self.port,
+                                                  address,
                                                   self.name,
-                                                  qthread=self.qthread)
+                                                  self.loop)
 
         # Start listening as a server.
         #
         else:
-            CommunicationServer(self.proxy, self.host, self.port)
+            CommunicationServer.proxy = self.proxy()
 
-        asyncore.loop(timeout=0.5)
+            CommunicationServer((self.host, self.port), self.loop)
 
-    def _send_client(self, message):
+            if self.path:
+                CommunicationServer(self.path, self.loop)
+
+            self.interval = config.getfloat("socket", "heartbeat_interval")
+            self.loop.call_later(self.interval, self._ping)
+
+        self.loop.run()
+
+    def _ping(self):
         """
-        Check for an active connection and then send a message to the server.
+        Ping each client, dropping any that we haven't heard from in too long.
         """
 
-        try:
-            # Check that we are connected.
-            if self.connection.connected:
-                # Write the message to the buffer so that it will be sent.
-                self.connection.buffer_ = self.packer.pack(message)
+        self.loop.call_later(self.interval, self._ping)
 
-                log.info("%s buffered: %s", self.name, message)
+        # A connection under several names is only pinged once.
+        for connection in set(Communicate.connections.values()):
+            if connection.heartbeat.stale():
+                log.error("Heard nothing from %s, dropping", connection.name)
+
+                connection.handle_close()
 
             else:
+                connection._reply(connection.heartbeat.ping())
+
+    def _send_client(self, message):
+        """
+        Check for an active connection and then queue a message to be sent to
+        the server.
+        """
+
+        try:
+            # Check that we are connected, or about to be.
+            if not (self.connection.connected or self.connection.connecting):
                 log.error("Send failed: No active connection found")
 
                 return False
 
+            if not self.connection.queue.put(message):
+                log.error("Send failed: Queue full for %s", self.name)
+
+                return False
+
+            log.info("%s queued: %s", self.name, message)
+
         except AttributeError as excp:
             log.error("Send failed: %s", excp)
 
@@ -192,22 +340,31 @@ class CommunicationHandler(object):
 
     def _send_server(self, names, message):
         """
-        Send a message to the named connection(s).
+        Send a message to the named connection(s). The message is packed once
+        and then queued for each connection, so that it goes out to all of
+        them as close together as possible.
         """
 
-        try:
-            for name in names:
-                connection = Communicate.connections[name]
-                connection.send(self.packer.pack(message))
+        data = serializer.pack(message)
+        result = True
 
-                log.info("Sent to %s: %s", name, message)
+        for name in names:
+            connection = Communicate.connections.get(name)
 
-        except (KeyError, RuntimeError) as excp:
-            log.error("Send failed: %s", excp)
+            if not connection:
+                log.error("Send failed: No connection to %s", name)
 
-            return False
+                result = False
 
-        return True
+            elif not connection.put(connection.route(name, message, data)):
+                log.error("Send failed: Queue full for %s", name)
+
+                result = False
+
+            else:
+                log.info("Sent to %s: %s", name, message)
+
+        return result
 
 
 class CommunicationClient(asyncore.dispatcher):
@@ -215,60 +372,87 @@ class CommunicationClient(asyncore.dispatcher):
     Connect to a server and send/receive remote method calls asynchronously.
     """
 
-    buffer_ = ""
-
-    def __init__(self, proxy, host, port, name, qthread=False):
+    def __init__(self, proxy, address, name, loop):
         asyncore.dispatcher.__init__(self)
 
         log.info("CommunicationClient initialised")
 
-        self.unpacker = msgpack.Unpacker()
-        self.proxy = proxy()
-        self.host = host
-        self.port = port
+        self.queue = WriteQueue(loop.wake)
+        self.unpacker = serializer.unpacker(MAX_BUFFER_SIZE)
+        self.buffer = bytearray(READ_SIZE)
+        self.address = address
         self.name = name
-        self.qthread = qthread
+        self.loop = loop
+        self.delay = RECONNECT_MIN
+        self.heartbeat = Heartbeat()
+
+        # A host of several clients has a proxy for each of their names.
+        if isinstance(proxy, dict):
+            self.proxy = dict((n, p()) for n, p in proxy.items())
+
+        else:
+            self.proxy = proxy()
+
         self._connect()
 
+        self.loop.call_later(self.heartbeat.interval, self._check)
+
     def _connect(self):
+        """
+        Begin a non-blocking connection to the server, which completes in
+        handle_connect or fails in handle_close.
+        """
+
         self.connected = False
 
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Anything still queued was meant for the old connection.
+        self.queue.clear()
+
+        # Our name goes first, so the server can register the connection.
+        self.queue.put(self.name)
+
+        self.create_socket(_get_family(self.address), socket.SOCK_STREAM)
 
         try:
-            self.connect((self.host, self.port))
+            self.connect(self.address)
 
-        except socket.gaierror as excp:
+        except socket.error as excp:
             log.error("%s failed to connect: %s", self.name, excp)
 
-            raise
+            self.close()
+            self._reconnect()
 
-        # Send our name to the server to register the connection with.
-        #
-        try:
-            while True:
-                if self.qthread:
-                    sent = self.send(CommunicationQThread.packer.pack(self.name))
-                
-                else:
-                    sent = self.send(CommunicationThread.packer.pack(self.name))
-
-                if sent != 0:
-                    break
+    def _reconnect(self):
+        log.warn("Reconnecting to server in %s seconds", self.delay)
 
-            self.connected = True
+        self.loop.call_later(self.delay, self._connect)
+        self.delay = min(self.delay * 2, RECONNECT_MAX)
 
-            log.warn("%s sent name" % self.name)
+    def _check(self):
+        """
+        Drop the connection if the server has stopped pinging us, as it may
+        have gone without the connection being closed.
+        """
 
-        except socket.error as excp:
-            log.error("%s failed to send name: %s", self.name, excp)
+        self.loop.call_later(self.heartbeat.interval, self._check)
+
+        if self.connected and self.heartbeat.stale():
+            log.error("%s heard nothing from server, reconnecting", self.name)
+
+            self.handle_close()
+
+    def handle_connect(self):
+        self.delay = RECONNECT_MIN
+        self.heartbeat.reset()
+
+        log.warn("%s connected to server", self.name)
 
     def writable(self):
-        return (len(self.buffer_) > 0)
+        return len(self.queue) > 0
 
     def handle_write(self):
-        sent = self.send(self.buffer_)
-        self.buffer_ = self.buffer_[sent:]
+        sent = self.send(self.queue.peek())
+        self.queue.consume(sent)
 
     def handle_read(self):
         """
@@ -276,36 +460,514 @@ class CommunicationClient(asyncore.dispatcher):
         """
 
         try:
-            self.unpacker.feed(self.recv(1))
+            if not _receive(self):
+                return
 
             for message in self.unpacker:
-                log.info("%s received: %s", self.name, message)
+                if self.heartbeat.handle(message, self._reply):
+                    continue
 
-                # Attempt to call the requested method on the proxy.
-                #
-                try:
-                    method = message.keys()[0]
-
-                    try:
-                        getattr(self.proxy, method)(message[method])
+                log.info("%s received: %s", self.name, message)
 
-                    except AttributeError as excp:
-                        log.error("Failed to call method %s: %s", method, excp)
+                proxy, message = self._route(message)
 
-                except AttributeError as excp:
-                    log.error("Failed to call a method: %s", excp)
+                _dispatch(proxy, message, self._reply)
 
         except socket.error as excp:
             log.error("Failed to receive: %s", excp)
 
+        except msgpack.BufferFull:
+            log.error("Receive buffer full, dropping connection")
+
+            self.handle_close()
+
+    def _route(self, message):
+        """
+        Find the proxy a message is for, unwrapping it if it was routed to
+        one of our names.
+        """
+
+        if isinstance(message, dict) and "route" in message:
+            name, message = message["route"]
+
+            return self.proxy.get(name), message
+
+        return self.proxy, message
+
+    def _reply(self, message):
+        self.queue.put(message)
+
+    def handle_error(self):
+        log.error("%s connection failed: %s", self.name, sys.exc_info()[1])
+
+        self.handle_close()
+
     def handle_close(self):
         self.close()
         self.connected = False
         log.info("CommunicationClient closed")
 
-        time.sleep(5)
-        log.warn("Attempting to reconnect to server")
-        self._connect()
+        self._reconnect()
+
+
+class CommunicationLoop(object):
+    """
+    Run the asyncore loop along with any timers that are due.
+
+    Other threads queue data to send without the loop knowing, so they wake it
+    through a pipe that it watches. Where pipes cannot be watched, fall back
+    to waking periodically.
+    """
+
+    def __init__(self):
+        self._timers = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._waker = None
+        self._ident = None
+
+        if hasattr(asyncore, "file_dispatcher"):
+            self._waker = CommunicationWaker()
+
+    def call_later(self, delay, function):
+        with self._lock:
+            heapq.heappush(self._timers, (time.time() + delay,
+                                          next(self._counter),
+                                          function))
+
+        self.wake()
+
+    def wake(self):
+        if self._waker:
+            self._waker.wake()
+
+    def is_current(self):
+        return threading.current_thread().ident == self._ident
+
+    def run(self):
+        self._ident = threading.current_thread().ident
+
+        while True:
+            timeout = self._run_timers()
+
+            # With nothing to poll, asyncore returns at once rather than
+            # waiting, as between reconnects where there is no waker.
+            if not asyncore.socket_map:
+                time.sleep(timeout if timeout is not None else 0.5)
+
+                continue
+
+            asyncore.loop(timeout=timeout, count=1)
+
+    def _run_timers(self):
+        """
+        Call the timers that are due, then return how long the loop may sleep
+        before the next one is.
+        """
+
+        while True:
+            with self._lock:
+                if not self._timers:
+                    break
+
+                when, _, function = self._timers[0]
+
+                if when > time.time():
+                    break
+
+                heapq.heappop(self._timers)
+
+            try:
+                function()
+
+            except Exception as excp:
+                log.error("Timer %s failed: %s", function, excp)
+
+        with self._lock:
+            if self._timers:
+                timeout = max(self._timers[0][0] - time.time(), 0)
+
+            else:
+                timeout = None
+
+        if not self._waker:
+            timeout = min(timeout, 0.5) if timeout is not None else 0.5
+
+        return timeout
+
+
+if hasattr(asyncore, "file_dispatcher"):
+    class CommunicationWaker(asyncore.file_dispatcher):
+        """
+        Wake the loop from another thread by writing to a pipe it watches.
+        """
+
+        def __init__(self):
+            read, self._write = os.pipe()
+
+            asyncore.file_dispatcher.__init__(self, read)
+
+            # If the pipe is full the loop is already due to wake.
+            flags = fcntl.fcntl(self._write, fcntl.F_GETFL, 0)
+            fcntl.fcntl(self._write, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        def wake(self):
+            try:
+                os.write(self._write, "x")
+
+            except OSError as excp:
+                if excp.errno != errno.EAGAIN:
+                    raise
+
+        def writable(self):
+            return False
+
+        def handle_read(self):
+            self.recv(READ_SIZE)
+
+
+class Future(object):
+    """
+    The result of a remote method call, available once the other end has
+    responded. Proxy methods may also return one to respond later on.
+    """
+
+    _pending = {}
+    _pending_lock = threading.Lock()
+    _counter = itertools.count(1)
+
+    def __init__(self):
+        self.request_id = None
+        self.value = None
+        self.error = None
+
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def register(cls):
+        """
+        Create a Future that will be resolved by the response to a request.
+        """
+
+        future = cls()
+
+        with cls._pending_lock:
+            future.request_id = next(cls._counter)
+            cls._pending[future.request_id] = future
+
+        return future
+
+    @classmethod
+    def resolve(cls, request_id, value, error):
+        with cls._pending_lock:
+            future = cls._pending.pop(request_id, None)
+
+        if future:
+            future.set_result(value, error)
+
+        else:
+            log.warn("Response to unknown request: %s", request_id)
+
+    def cancel(self):
+        with self._pending_lock:
+            self._pending.pop(self.request_id, None)
+
+    def expire(self):
+        with self._pending_lock:
+            pending = self._pending.pop(self.request_id, None)
+
+        if pending:
+            self.set_result(None, "Request %s timed out" % self.request_id)
+
+    def done(self):
+        return self._done.is_set()
+
+    def set_result(self, value, error=None):
+        with self._lock:
+            self.value = value
+            self.error = error
+            self._done.set()
+
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+
+                return
+
+        callback(self)
+
+    def result(self, timeout=None):
+        """
+        Wait for and return the result, raising a CommunicationError if the
+        call failed.
+        """
+
+        if not self._done.wait(timeout):
+            self.cancel()
+
+            raise CommunicationError("Request %s timed out" % self.request_id)
+
+        if self.error:
+            raise CommunicationError(self.error)
+
+        return self.value
+
+
+def _get_family(address):
+    """
+    Addresses are either (host, port) for TCP, or a path for a Unix socket.
+    """
+
+    if isinstance(address, basestring):
+        return socket.AF_UNIX
+
+    return socket.AF_INET
+
+def _receive(connection):
+    """
+    Read whatever has arrived on a connection into its buffer, and hand that
+    to its unpacker without copying it. Returns False if the connection has
+    been closed.
+    """
+
+    try:
+        received = connection.socket.recv_into(connection.buffer)
+
+    except socket.error as excp:
+        if excp.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return True
+
+        if excp.args[0] in asyncore._DISCONNECTED:
+            connection.handle_close()
+
+            return False
+
+        raise
+
+    if not received:
+        connection.handle_close()
+
+        return False
+
+    connection.unpacker.feed(memoryview(connection.buffer)[:received])
+    connection.heartbeat.reset()
+
+    return True
+
+def _dispatch(proxy, message, reply):
+    """
+    Call the method named by a message on the proxy. The result of a request
+    is sent back through reply, while a response resolves its Future.
+    """
+
+    try:
+        method = message.keys()[0]
+
+    except AttributeError as excp:
+        log.error("Failed to call a method: %s", excp)
+
+        return
+
+    if method == "response":
+        Future.resolve(*message[method])
+
+        return
+
+    if method != "request":
+        try:
+            getattr(proxy, method)(message[method])
+
+        except AttributeError as excp:
+            log.error("Failed to call method %s: %s", method, excp)
+
+        return
+
+    request_id, method, argument = message["request"]
+
+    def respond(future):
+        reply({"response": [request_id, future.value, future.error]})
+
+    try:
+        result = getattr(proxy, method)(argument)
+
+    except Exception as excp:
+        log.error("Failed to call method %s: %s", method, excp)
+
+        reply({"response": [request_id, None, str(excp)]})
+
+        return
+
+    if isinstance(result, Future):
+        result.add_done_callback(respond)
+
+    else:
+        reply({"response": [request_id, result, None]})
+
+
+class WriteQueue(object):
+    """
+    Hold packed messages until they can be written to a socket.
+
+    Messages are sent in order. Large ones are sent from memoryviews so that
+    partial sends do not copy the remainder, while runs of small ones are
+    joined so that a burst goes out in a single write. A status update that
+    has not begun sending is merged with any newer update that follows on
+    from it, so a burst of updates costs a single message.
+
+    The wake function is called whenever the queue stops being empty, so that
+    the loop knows there is something to write.
+    """
+
+    def __init__(self, wake, limit=MAX_QUEUE_SIZE):
+        self.wake = wake
+        self.limit = limit
+        self.size = 0
+
+        self._items = collections.deque()
+        self._update = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, message):
+        """
+        Queue a message, returning False if the queue is already full.
+        """
+
+        with self._lock:
+            if self._update and _is_update(message):
+                merged = _merge_updates(self._update[0], message)
+
+                if merged:
+                    data = serializer.pack(merged)
+                    growth = len(data) - len(self._update[1])
+
+                    # Merging grows the queue, so is held to the same limit.
+                    if self.size + growth > self.limit:
+                        return False
+
+                    self.size += growth
+                    self._update[0] = merged
+                    self._update[1] = memoryview(data)
+
+                    return True
+
+            item = self._append(message, serializer.pack(message))
+
+            if item and _is_update(message):
+                self._update = item
+
+        return bool(item)
+
+    def put_packed(self, data):
+        """
+        Queue a message that has already been packed, such as one that is
+        being sent to several connections, so that they can share its data.
+        """
+
+        with self._lock:
+            item = self._append(None, data)
+
+        return bool(item)
+
+    def peek(self):
+        """
+        Return the unsent data of the oldest message, along with any small
+        messages that follow it.
+        """
+
+        with self._lock:
+            views = []
+            size = 0
+
+            for item in self._items:
+                if views and size + len(item[1]) > BATCH_SIZE:
+                    break
+
+                # Once a message starts sending it can no longer be changed.
+                if item is self._update:
+                    self._update = None
+
+                views.append(item[1])
+                size += len(item[1])
+
+        if len(views) == 1:
+            return views[0]
+
+        return "".join(view.tobytes() for view in views)
+
+    def consume(self, sent):
+        with self._lock:
+            self.size -= sent
+
+            while sent:
+                item = self._items[0]
+
+                if sent < len(item[1]):
+                    item[1] = item[1][sent:]
+
+                    break
+
+                sent -= len(item[1])
+                self._items.popleft()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._update = None
+            self.size = 0
+
+    def _append(self, message, data):
+        if self.size + len(data) > self.limit:
+            return
+
+        item = [message, memoryview(data)]
+
+        self._items.append(item)
+        self.size += len(data)
+
+        if len(self._items) == 1:
+            self.wake()
+
+        return item
+
+
+def _is_update(message):
+    return isinstance(message, dict) and "update" in message
+
+
+def _merge_updates(old, new):
+    """
+    Combine two status updates, provided that the new one builds on the old.
+    See Control._send_update for the format.
+    """
+
+    name, changes, since, version = old["update"]
+    new_name, new_changes, new_since, new_version = new["update"]
+
+    if new_name != name:
+        return
+
+    # A full status replaces everything before it.
+    if not new_since:
+        return new
+
+    if new_since != version:
+        return
+
+    merged = dict(changes)
+    merged.update(new_changes)
+
+    return {"update": [name, merged, since, new_version]}
 
 
 class CommunicationServer(asyncore.dispatcher):
@@ -315,89 +977,209 @@ class CommunicationServer(asyncore.dispatcher):
 
     proxy = None
 
-    def __init__(self, proxy, host, port):
+    def __init__(self, address, loop):
         asyncore.dispatcher.__init__(self)
 
         log.info("CommunicationServer initialised")
 
-        CommunicationServer.proxy = proxy()
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.set_reuse_addr()
+        self.loop = loop
+
+        family = _get_family(address)
+
+        self.create_socket(family, socket.SOCK_STREAM)
+
+        if family == socket.AF_INET:
+            self.set_reuse_addr()
+
+        # A socket file left behind by a previous run would stop us binding,
+        # but anything else at the path is not ours to remove.
+        elif os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                log.error("Not a socket, refusing to replace: %s", address)
+
+                raise CommunicationError("%s is not a socket" % address)
+
+            os.unlink(address)
 
         try:
-            self.bind((host, port))
+            self.bind(address)
 
         except socket.error as excp:
             log.error("Failed to bind socket: %s", excp)
 
             raise
 
-        log.warn("Listening on port: %s", port)
+        log.warn("Listening on: %s", address)
 
         self.listen(5)
 
     def handle_accept(self):
         client, address = self.accept()
 
-        log.warn("Received connection from: %s", address[0])
+        log.warn("Received connection from: %s", address[0] if address
+                                                  else "Unix socket")
 
         # Pass this client off to a handler.
-        CommunicationClientHandler(client)
+        CommunicationClientHandler(client, self.loop)
 
 
-class CommunicationClientHandler(asyncore.dispatcher_with_send):
+class CommunicationClientHandler(asyncore.dispatcher):
     """
     Send/receive remote method calls to/from a server.
     """
 
-    def __init__(self, client):
-        asyncore.dispatcher_with_send.__init__(self, client)
+    def __init__(self, client, loop):
+        asyncore.dispatcher.__init__(self, client)
 
-        self.unpacker = msgpack.Unpacker()
+        self.queue = WriteQueue(loop.wake)
+        self.unpacker = serializer.unpacker(MAX_BUFFER_SIZE)
+        self.buffer = bytearray(READ_SIZE)
+        self.loop = loop
         self.name = None
+        self.names = []
+        self.heartbeat = Heartbeat()
+
+        # Only named clients are pinged, so give up on any that never say.
+        self.loop.call_later(self.heartbeat.timeout, self._check_named)
+
+    def put(self, data):
+        """
+        Queue packed data to be sent to the client.
+        """
+
+        return self.queue.put_packed(data)
+
+    def route(self, name, message, data):
+        """
+        Get the packed data to send a message to one of the client's names.
+        A client under a single name needs no routing, and is sent the data
+        packed once for everyone.
+        """
+
+        if len(self.names) > 1:
+            return serializer.pack({"route": [name, message]})
+
+        return data
+
+    def writable(self):
+        return len(self.queue) > 0
+
+    def handle_write(self):
+        sent = self.send(self.queue.peek())
+        self.queue.consume(sent)
 
     def handle_read(self):
         """
         Stream incoming messages into MessagePack and action them when ready.
         """
 
-        self.unpacker.feed(self.recv(1))
+        try:
+            if not _receive(self):
+                return
+
+        except msgpack.BufferFull:
+            log.error("Receive buffer full, dropping %s", self.name)
+
+            self.handle_close()
+
+            return
 
         for message in self.unpacker:
             if not self.name:
                 # The first message received from a new connection will be the
-                # name of the client, which we can store and use in future to
-                # access this connection.
+                # name of the client, or a list of them, which we can store and
+                # use in future to access this connection.
                 #
+                names = message if isinstance(message, list) else [message]
+
                 try:
-                    Communicate.connections[message] = self
-                    self.name = message
+                    for name in names:
+                        Communicate.connections[name] = self
+
+                    self.names = names
+                    self.name = ", ".join(names)
 
                     log.info("%s connected", self.name)
 
                 except TypeError as excp:
                     log.error("Failed to set name: %s", excp)
 
-            else:
+            elif not self.heartbeat.handle(message, self._reply):
                 log.info("Received from %s: %s", self.name, message)
 
-                # Attempt to call the requested method on the proxy.
-                #
-                method = message.keys()[0]
+                _dispatch(CommunicationServer.proxy, message, self._reply)
 
-                try:
-                    getattr(CommunicationServer.proxy, method)(message[method])
+    def _reply(self, message):
+        self.put(serializer.pack(message))
+
+    def _check_named(self):
+        if not self.name:
+            log.error("Connection never gave its name, dropping")
 
-                except AttributeError as excp:
-                    log.error("Failed to call method %s: %s", method, excp)
+            self.handle_close()
 
     def handle_close(self):
         self.close()
 
-        try:
-            Communicate.connections.pop(self.name, None)
+        # Let the proxy forget about the client too, if it wants to.
+        disconnected = getattr(CommunicationServer.proxy, "disconnected", None)
+
+        for name in self.names:
+            # The client may already have reconnected, leaving us stale.
+            if Communicate.connections.get(name) is not self:
+                continue
+
+            Communicate.connections.pop(name, None)
+
+            log.warn("%s disconnected", name)
+
+            if disconnected:
+                disconnected(name)
+
+
+class Heartbeat(object):
+    """
+    Keep track of whether the other end of a connection is still there, and
+    how long a message takes to get there and back.
+    """
+
+    def __init__(self):
+        self.interval = config.getfloat("socket", "heartbeat_interval")
+        self.timeout = config.getfloat("socket", "heartbeat_timeout")
+        self.rtt = None
+
+        self.reset()
+
+    def reset(self):
+        """
+        Note that we have just heard from the other end.
+        """
+
+        self.received = time.time()
+
+    def stale(self):
+        return time.time() - self.received > self.timeout
+
+    def ping(self):
+        return {"ping": time.time()}
+
+    def handle(self, message, reply):
+        """
+        Answer a ping, or measure the round trip from a pong. Returns True if
+        the message was one of these, and so needs no further handling.
+        """
+
+        if not isinstance(message, dict) or len(message) != 1:
+            return False
+
+        if "ping" in message:
+            reply({"pong": message["ping"]})
+
+            return True
+
+        if "pong" in message:
+            self.rtt = time.time() - message["pong"]
 
-        except TypeError as excp:
-            log.error("Failed to remove connection: %s", excp)
+            return True
 
-        log.warn("%s disconnected", self.name)
+        return False
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+Keep an index of the files under the downloads directory, so that listing or
+finding them doesn't mean walking the whole tree each time.
+"""
+
+import os
+import threading
+import time
+
+try:
+    import pyinotify
+
+except ImportError:
+    pyinotify = None
+
+from lib.medusa import utilities
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class DownloadsIndex(object):
+    """
+    A directory's modification time changes whenever an entry is added to,
+    removed from, or renamed within it. So a refresh only lists directories
+    whose modification time has changed since they were last listed, and
+    otherwise just checks each directory's time.
+
+    Where pyinotify is available, even that is skipped until something under
+    the directory has actually changed. Directories in which files have been
+    written are listed again too, to pick up the files' new times.
+    """
+
+    __metaclass__ = utilities.Singleton
+
+    def __init__(self, path):
+        self.path = unicode(path)
+
+        # Each directory's modification time, files, and subdirectories.
+        self._directories = {}
+        self._files = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+        self._changed = True
+        self._stale = set()
+        self._notifier = None
+
+        if pyinotify:
+            self._watch()
+
+    def files(self):
+        """
+        Get the modification time, name and path of every file.
+        """
+
+        with self._lock:
+            self._refresh()
+
+            return list(self._files)
+
+    def find(self, name):
+        """
+        Get the path of the file with the given name, if there is one.
+        """
+
+        with self._lock:
+            self._refresh()
+
+            return self._names.get(name)
+
+    #--------------------------------------------------------------------------
+
+    def _refresh(self):
+        if not self._changed:
+            return
+
+        # Without notifications there is no telling what changed next time.
+        self._changed = not self._notifier
+
+        stale, self._stale = self._stale, set()
+        directories = {}
+        stack = [self.path]
+
+        while stack:
+            directory = stack.pop()
+
+            try:
+                modified = os.path.getmtime(directory)
+
+            except OSError:
+                continue
+
+            cached = self._directories.get(directory)
+
+            if not cached or cached[0] != modified or directory in stale:
+                cached = self._list(directory, modified)
+
+            directories[directory] = cached
+            stack.extend(cached[2])
+
+        self._directories = directories
+        self._files = []
+        self._names = {}
+
+        for modified, files, subdirectories in directories.values():
+            for file_ in files:
+                self._files.append(file_)
+                self._names[file_[1]] = file_[2]
+
+    def _list(self, directory, modified):
+        files = []
+        subdirectories = []
+
+        try:
+            names = os.listdir(directory)
+
+        except OSError as excp:
+            log.error("Failed to list %s: %s", directory, excp)
+
+            return modified, files, subdirectories
+
+        for name in names:
+            path = os.path.join(directory, name)
+
+            try:
+                if os.path.isdir(path):
+                    subdirectories.append(path)
+
+                else:
+                    files.append((os.path.getmtime(path), name, path))
+
+            except OSError:
+                continue
+
+        # Times may only be accurate to the second, so a directory changed
+        # again within the same second would look unchanged. Until it is safe
+        # to trust its time, keep listing it.
+        #
+        if time.time() - modified < 2:
+            modified = None
+
+        return modified, files, subdirectories
+
+    def _watch(self):
+        """
+        Have inotify tell us when anything under the directory changes.
+        """
+
+        index = self
+
+        class Handler(pyinotify.ProcessEvent):
+
+            def process_default(self, event):
+                # Refreshing swaps the stale set, so mustn't miss this add.
+                with index._lock:
+                    index._stale.add(event.path)
+                    index._changed = True
+
+        mask = (pyinotify.IN_CREATE |
+                pyinotify.IN_DELETE |
+                pyinotify.IN_MOVED_FROM |
+                pyinotify.IN_MOVED_TO |
+                pyinotify.IN_CLOSE_WRITE)
+
+        try:
+            manager = pyinotify.WatchManager()
+            manager.add_watch(self.path, mask, rec=True, auto_add=True)
+
+            self._notifier = pyinotify.ThreadedNotifier(manager, Handler())
+            self._notifier.daemon = True
+            self._notifier.start()
+
+        except Exception as excp:
+            log.error("Failed to watch %s: %s", self.path, excp)
+
+            self._notifier = None
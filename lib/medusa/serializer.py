@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Serialize messages for communication using MessagePack.
+
+Text and binary data are kept apart on the wire, so unicode strings arrive as
+unicode and byte strings as bytes. Further types can be registered to be sent
+as MessagePack extension types.
+"""
+
+import threading
+
+import msgpack
+
+#------------------------------------------------------------------------------
+
+_local = threading.local()
+
+# Registered extension types, by type when packing and by code when unpacking.
+_encoders = {}
+_decoders = {}
+
+#------------------------------------------------------------------------------
+
+def pack(message):
+    """
+    Pack a message with a packer belonging to the current thread, as packers
+    keep internal state and must not be shared between threads.
+    """
+
+    try:
+        packer = _local.packer
+
+    except AttributeError:
+        packer = _local.packer = _new_packer()
+
+    return packer.pack(message)
+
+def unpack(data):
+    return msgpack.unpackb(data, raw=False, ext_hook=_decode)
+
+def unpacker(max_buffer_size=0):
+    """
+    Create an Unpacker to stream messages from a connection. Each connection
+    needs its own, as it holds any partially received message.
+    """
+
+    return msgpack.Unpacker(raw=False,
+                            ext_hook=_decode,
+                            max_buffer_size=max_buffer_size)
+
+def register(code, type_, encode, decode):
+    """
+    Send instances of a type as an extension type with the given code, from
+    0 to 127. encode turns an instance into something that can be packed,
+    and decode turns that back into an instance. Tuples, including named
+    ones, are always sent as arrays and so can't be registered.
+    """
+
+    _encoders[type_] = (code, encode)
+    _decoders[code] = decode
+
+#------------------------------------------------------------------------------
+
+def _new_packer():
+    return msgpack.Packer(use_bin_type=True, default=_encode)
+
+def _encode(value):
+    try:
+        code, encode = _encoders[type(value)]
+
+    except KeyError:
+        raise TypeError("Cannot serialize %r" % value)
+
+    # The thread's packer is busy with the enclosing message.
+    data = msgpack.packb(encode(value), use_bin_type=True, default=_encode)
+
+    return msgpack.ExtType(code, data)
+
+def _decode(code, data):
+    try:
+        decode = _decoders[code]
+
+    except KeyError:
+        return msgpack.ExtType(code, data)
+
+    return decode(unpack(data))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+Make requests to the Head's API without blocking the Qt thread.
+"""
+
+import Queue
+import threading
+import time
+
+from PyQt4 import QtCore
+import requests
+
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class Api(QtCore.QObject):
+    """
+    Requests are made in order by a worker thread, over a single keep-alive
+    session. Their results are handed back to callbacks on the Qt thread.
+    """
+
+    _finished = QtCore.pyqtSignal(object, object)
+
+    def __init__(self):
+        super(Api, self).__init__()
+
+        self.base = "http://%s:%s/%s/%s" % (config.get("head", "host"),
+                                            config.get("ports", "head"),
+                                            config.get("head", "url_base"),
+                                            config.get("head", "api_base"))
+        self.timeout = config.getfloat("snake", "api_timeout")
+        self.retries = config.getint("snake", "api_retries")
+
+        self.session = requests.Session()
+        self._requests = Queue.Queue()
+
+        self._finished.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get(self, bits, callback=None):
+        """
+        Queue a request for the API path made up of bits. If given, callback
+        is called with the decoded response, or an empty dictionary if the
+        request failed.
+        """
+
+        self._requests.put((bits, callback))
+
+    #--------------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            bits, callback = self._requests.get()
+
+            result = self._fetch(bits)
+
+            if callback:
+                self._finished.emit(callback, result)
+
+    def _fetch(self, bits):
+        """
+        Make a request, retrying with an increasing delay on connection errors
+        and server errors.
+        """
+
+        url = "%s/%s" % (self.base, "/".join(str(b) for b in bits))
+        delay = 0.5
+        error = None
+
+        for attempt in range(self.retries + 1):
+            if error:
+                log.warn("API call to %s failed, retrying: %s", url, error)
+
+                time.sleep(delay)
+                delay *= 2
+
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+
+            except (requests.ConnectionError, requests.Timeout) as excp:
+                error = excp
+
+                continue
+
+            if response.status_code >= 500:
+                error = "HTTP %s" % response.status_code
+
+                continue
+
+            try:
+                response.raise_for_status()
+
+                return response.json()
+
+            except Exception as excp:
+                error = excp
+
+                break
+
+        log.error("API call to %s failed: %s", url, error)
+
+        return {}
+
+    def _deliver(self, callback, result):
+        callback(result)
@@ -4,42 +4,102 @@
 Handle actions from the Head with regards to VLC media playback.
 """
 
-import glob
 import os
 import time
+import traceback
 
 from PyQt4 import QtCore
 from PyQt4 import QtGui
-import requests
 
 from lib.medusa.config import config
+from lib.medusa.downloads import DownloadsIndex
 from lib.medusa.log import log
+from lib.snake import profile
 from lib.snake import vlc
+from lib.snake.api import Api
+from lib.snake.disc import DiscMonitor
+from lib.snake.playlist import Playlist
 
 #------------------------------------------------------------------------------
 
 class Control(QtGui.QWidget):
 
-    _queue = []
     _play = QtCore.pyqtSignal()
     _stop = QtCore.pyqtSignal()
-
-    def __init__(self):
+    _changed = QtCore.pyqtSignal()
+    _time_changed = QtCore.pyqtSignal(object, object)
+    _ended = QtCore.pyqtSignal()
+    _playing = QtCore.pyqtSignal()
+    _failed = QtCore.pyqtSignal()
+    _action = QtCore.pyqtSignal(object, object)
+    _resolved = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, instance=None):
         super(Control, self).__init__()
 
         self.name = ""
         self.media_path = ""
         self.downloads_path = ""
         self.communicate = None
+        self.clock = None
+        self.api = Api()
+        self.playlist = Playlist()
         self.media_id = None
         self.media_name = ""
 
+        # A libVLC instance may be shared with other Controls in the process.
+        self.instance = instance
+
+        # The ID of the next item in the queue, along with its Media ready to
+        # be played.
+        self._next = None
+
+        # The last status sent to the Head, so that only changes need be sent.
+        self._status = {}
+        self._status_version = 0
+
         self.jump_increment = config.getint("snake", "jump_increment")
         self.overlay_time = config.getint("snake", "overlay_time") * 1000
         self.volume_increment = config.getint("snake", "volume_increment")
         self.volume_max = config.getint("snake", "volume_max")
         self.volume_min = config.getint("snake", "volume_min")
 
+        # Languages of the tracks to choose, in order of preference.
+        self.audio_languages = self._get_languages("audio_languages")
+        self.subtitle_languages = self._get_languages("subtitle_languages")
+
+        # Attempts left at starting the current media, and how long each has.
+        self.start_attempts = config.getint("snake", "start_attempts")
+        self.start_timeout = config.getint("snake", "start_timeout")
+        self._start_attempts = 0
+
+        # Jumps made in quick succession are added up into a single seek to
+        # the target, which is timed until playback carries on from there.
+        self.seek_delay = config.getint("snake", "seek_delay")
+        self.seek_fast = config.getint("snake", "seek_fast") * 1000
+        self._seek_target = None
+        self._seek_from = None
+        self._seek_to = None
+        self._seek_issued = None
+        self._seek_latency = None
+
+        # Elapsed time is reported at most once per update interval.
+        self.update_interval = config.getint("snake", "update") / 1000.0
+        self._reported_elapsed = None
+        self._reported_at = 0
+
+        # How far into the current item playback has got is saved with the
+        # queue this often, to resume from after a restart.
+        self.position_save = config.getint("snake", "position_save")
+        self._position_saved_at = 0
+
+        # When playing in sync with other Snakes, the local time at which the
+        # media would have been at its start, had it played from there.
+        self._sync_start = None
+        self.drift_jump = config.getint("sync", "drift_jump")
+        self.drift_rate = config.getfloat("sync", "drift_rate")
+        self.drift_tolerance = config.getint("sync", "drift_tolerance")
+
         self.setup()
 
     def setup(self):
@@ -47,7 +107,13 @@ class Control(QtGui.QWidget):
         Prepare the GUI and VLC instance for playback.
         """
 
-        self.instance = vlc.Instance()
+        self.profile = config.get("snake", "profile")
+        self.media_options = profile.get_media_options(self.profile)
+
+        if not self.instance:
+            self.instance = vlc.Instance(
+                *profile.get_instance_arguments(self.profile))
+
         self.player = self.instance.media_player_new()
 
         self.player.video_set_deinterlace("blend")
@@ -62,6 +128,92 @@ class Control(QtGui.QWidget):
         for option, setting in settings.items():
             self.player.video_set_marquee_int(option, setting)
 
+        self._attach_events()
+
+        # Discs coming and going are reported to the Head straight away.
+        self.disc_monitor = DiscMonitor()
+        self.disc_monitor.callbacks.append(
+            lambda path, name: self._changed.emit())
+
+        self._start_timer = QtCore.QTimer()
+        self._start_timer.setSingleShot(True)
+        self._start_timer.setInterval(self.start_timeout)
+        self._start_timer.timeout.connect(self._retry_start)
+
+        self._seek_timer = QtCore.QTimer()
+        self._seek_timer.setSingleShot(True)
+        self._seek_timer.setInterval(self.seek_delay)
+        self._seek_timer.timeout.connect(self._seek)
+
+        self._drift_timer = QtCore.QTimer()
+        self._drift_timer.setInterval(config.getint("sync", "drift_interval")
+                                      * 1000)
+        self._drift_timer.timeout.connect(self._correct_drift)
+
+        self._action.connect(self._perform, QtCore.Qt.QueuedConnection)
+        self._resolved.connect(self._call_back, QtCore.Qt.QueuedConnection)
+
+    def _attach_events(self):
+        """
+        Drive status updates and the end of playback from libVLC events.
+
+        The callbacks run on libVLC's own threads, where calling back into
+        libVLC is unsafe, so they only emit signals that are handled on the
+        Qt thread.
+        """
+
+        events = self.player.event_manager()
+
+        for event in (vlc.EventType.MediaPlayerPaused,
+                      vlc.EventType.MediaPlayerStopped,
+                      vlc.EventType.MediaPlayerLengthChanged,
+                      vlc.EventType.MediaPlayerESAdded,
+                      vlc.EventType.MediaPlayerESDeleted):
+            events.event_attach(event, self._on_changed)
+
+        events.event_attach(vlc.EventType.MediaPlayerPlaying,
+                            self._on_playing)
+        events.event_attach(vlc.EventType.MediaPlayerVout,
+                            self._on_vout)
+        events.event_attach(vlc.EventType.MediaPlayerTimeChanged,
+                            self._on_time_changed)
+        events.event_attach(vlc.EventType.MediaPlayerEndReached,
+                            self._on_ended)
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError,
+                            self._on_error)
+
+        self._changed.connect(self._send_update, QtCore.Qt.QueuedConnection)
+        self._time_changed.connect(self._update_time,
+                                   QtCore.Qt.QueuedConnection)
+        self._ended.connect(self._advance, QtCore.Qt.QueuedConnection)
+        self._playing.connect(self._started, QtCore.Qt.QueuedConnection)
+        self._failed.connect(self._retry_start, QtCore.Qt.QueuedConnection)
+
+    #--------------------------------------------------------------------------
+
+    def _perform(self, message, future):
+        """
+        Perform a playback action received from the Head, and complete its
+        Future with the result.
+        """
+
+        function = None
+
+        try:
+            function, arguments = message
+
+            result = getattr(self, function)(*arguments)
+
+            log.warn("Performed action: %s", function)
+
+            future.set_result(result)
+
+        except Exception as excp:
+            log.error("Action %s failed: %s", function, excp)
+            log.error(traceback.format_exc())
+
+            future.set_result(None, str(excp))
+
     #--------------------------------------------------------------------------
 
     def play(self, item=None):
@@ -70,36 +222,72 @@ class Control(QtGui.QWidget):
         it to the queue and then play it.
         """
 
+        if item and str(item).isdigit():
+            # Come back once the details of the item have been looked up.
+            self._get_media(int(item), self.play)
+
+            return
+
         if self.media_id:
             self.stop()
 
         if item:
             self._add_to_queue(item)
 
-        if self._queue:
-            item = self._queue.pop(0)
-
-        else:
+        if not self.playlist:
             return
 
+        item_id, item = self.playlist.pop()
+
         self.media_id = item[0]
         self.media_name = item[1]
-        elapsed = item[2]
-        path = item[3]
 
-        log.warn("About to play: %s", path)
+        log.warn("About to play: %s", item[3])
+
+        if self._next and self._next[0] == item_id:
+            media = self._next[1]
+            self._next = None
+
+        else:
+            self._discard_next()
+            media = self._new_media(item)
 
         self._insert_viewed(self.media_id)
-        self.player.set_media(self.instance.media_new(path))
-        self.start()
-        self._play.emit()
+        self.player.set_media(media)
 
-        if elapsed:
-            self.jump_to(elapsed)
+        # The player holds on to the media itself.
+        media.release()
+        self.start()
 
         self.overlay(self.media_name)
 
+    def play_at(self, at, item=None):
+        """
+        Play at a time given by the Head's clock, so that other Snakes sent
+        the same time start together with us. Our clock offset to the Head is
+        measured afresh first, as it may have drifted.
+        """
+
+        # Stop now, rather than at the start time, so that whatever is queued
+        # before then isn't played in the meantime.
+        if self.media_id:
+            self.stop()
+
+        if item:
+            self._add_to_queue(item)
+
+        # Use the time until the start to get the media ready.
+        self._preload()
+
+        self.clock.measure(lambda offset: self._resolved.emit(self._start_at,
+                                                              at))
+
     def pause(self):
+        self._end_sync()
+
+        if self.media_id:
+            self.playlist.set_elapsed(self._get_time()[0])
+
         if self._get_state() == "playing":
             self.overlay("Paused", forever=True)
 
@@ -109,8 +297,16 @@ class Control(QtGui.QWidget):
         self.player.pause()
 
     def stop(self):
+        self._start_attempts = 0
+        self._start_timer.stop()
+        self._seek_timer.stop()
+        self._seek_target = None
+        self._seek_issued = None
+
+        self._end_sync()
         self._update_elapsed()
         self.player.stop()
+        self.playlist.finish()
 
         self.media_id = None
         self.media_name = ""
@@ -138,30 +334,33 @@ class Control(QtGui.QWidget):
 
         self.player.audio_toggle_mute()
 
+        # There is no libVLC event for muting, so report it ourselves.
+        self._send_update()
+
     def jump_to(self, seconds):
-        elapsed, total = self._get_time()
+        self._end_sync()
 
-        if elapsed > int(seconds):
+        if self._get_seek_target() > int(seconds) * 1000:
             self.overlay("Jumped Backward")
 
         else:
             self.overlay("Jumped Forward")
 
-        self.player.set_time(int(seconds) * 1000)
+        self._jump(int(seconds) * 1000)
 
     def jump_forward(self):
-        elapsed, total = self._get_time()
+        self._end_sync()
 
         self.overlay("Jumped Forward")
 
-        self.player.set_time((elapsed + self.jump_increment) * 1000)
+        self._jump(self._get_seek_target() + self.jump_increment * 1000)
 
     def jump_backward(self):
-        elapsed, total = self._get_time()
+        self._end_sync()
 
         self.overlay("Jumped Backward")
 
-        self.player.set_time((elapsed - self.jump_increment) * 1000)
+        self._jump(self._get_seek_target() - self.jump_increment * 1000)
 
     def subtitle(self, track):
         self.player.video_set_spu(int(track))
@@ -190,19 +389,14 @@ class Control(QtGui.QWidget):
         """
         Begin media playback. Attempt this multiple times if necessary, as
         VLC will often fail on transient errors the first or second time.
-        """
-
-        attempts = 0
 
-        while attempts < 2:
-            self.player.play()
-
-            time.sleep(1)
+        Nothing here waits for playback to begin. libVLC reports that it has
+        through an event, or else that it failed, or we time out and retry.
+        """
 
-            if self._get_state() == "playing":
-                break
+        self._start_attempts = self.start_attempts
 
-            attempts += 1
+        self._try_start()
 
     def state(self):
         self._send_update()
@@ -224,43 +418,412 @@ class Control(QtGui.QWidget):
         self.player.video_set_marquee_int(vlc.VideoMarqueeOption.Timeout, time)
 
     def queue(self, item):
+        if str(item).isdigit():
+            self._get_media(int(item), self.queue)
+
+            return
+
         self._add_to_queue(item)
+        self._preload()
+        self._send_update()
+
+    def queue_many(self, items):
+        """
+        Queue several items at once, such as the rest of an album.
+        """
+
+        queued = []
+
+        for item in items:
+            if str(item).isdigit():
+                self._get_media(int(item), self.queue)
+
+            else:
+                queued.extend(self._build_items(item))
+
+        # Saving the queue once, rather than for each item.
+        self.playlist.extend(queued)
+        self._preload()
+        self._send_update()
+
+    def resync(self):
+        """
+        Send the full status, as the Head has lost track of it.
+        """
+
+        log.warn("Resynchronising status with the Head")
+
+        self._status = {}
+        self._send_update()
 
     def empty_queue(self):
         log.info("Emptying queue")
 
-        self._queue = []
+        self.playlist.clear()
+        self._discard_next()
+        self._send_update()
+
+    def insert(self, item, position):
+        """
+        Queue an item at a position in the queue, rather than at the end.
+        """
+
+        if str(item).isdigit():
+            self._get_media(int(item), lambda i: self.insert(i, position))
+
+            return
+
+        self._add_to_queue(item, int(position))
+        self._preload()
+        self._send_update()
+
+    def remove(self, item_id):
+        self.playlist.remove(item_id)
+        self._preload()
+        self._send_update()
+
+    def move(self, item_id, position):
+        self.playlist.move(item_id, int(position))
+        self._preload()
+        self._send_update()
 
     #--------------------------------------------------------------------------
 
-    def _add_to_queue(self, item):
+    def _add_to_queue(self, item, position=None):
         """
-        Find the path to the file(s) for a given media item and add it/them
-        to the queue along with useful metadata.
+        Add a media item to the queue, at the end unless a position is given.
         """
 
-        if str(item).isdigit():
-            media_id = int(item)
-            data = self._call_api(["media", media_id])
-            name = data.get("name_one", "")
-            elapsed = int(data.get("elapsed") or 0)
-            paths = sorted(data["paths"])
+        self.playlist.extend(self._build_items(item), position)
+
+    def _build_items(self, item):
+        """
+        Find the path to the file(s) for a given media item, and make a queue
+        item of each along with useful metadata.
+        """
+
+        items = []
+
+        if isinstance(item, dict):
+            media_id = int(item["id"])
+            name = item.get("name_one", "")
+            elapsed = int(item.get("elapsed") or 0)
+            paths = sorted(item["paths"])
+
+            tracks = item.get("tracks") or {}
 
             for path in paths:
+                options = self._get_track_options(tracks.get(path))
                 path = self._build_media_path(path)
 
-                self._queue.append((media_id, name, elapsed, path))
+                items.append((media_id, name, elapsed, path, options))
 
         elif item == "disc":
             path, name = self._build_disc_path()
 
             if path:
-                self._queue.append((item, name, 0, path))
+                items.append((item, name, 0, path))
 
         else:
             path = self._build_downloads_path(item)
 
-            self._queue.append((item, item, 0, path))
+            items.append((item, item, 0, path))
+
+        return items
+
+    def _get_track_options(self, tracks):
+        """
+        Choose the audio and subtitle tracks in the preferred languages, as
+        probed by the Head, so that they are playing from the start.
+        """
+
+        options = []
+
+        if not tracks:
+            return options
+
+        audio = self._find_track(tracks["audio"], self.audio_languages)
+        subtitles = self._find_track(tracks["subtitles"],
+                                     self.subtitle_languages)
+
+        if audio is not None:
+            options.append(":audio-track-id=%s" % audio)
+
+        if subtitles is not None:
+            options.append(":sub-track-id=%s" % subtitles)
+
+        return options
+
+    def _find_track(self, tracks, languages):
+        for language in languages:
+            for track_id, track_language, description in tracks:
+                if language in (track_language.lower(), description.lower()):
+                    return track_id
+
+    def _get_languages(self, option):
+        languages = config.getlist("snake", option)
+
+        return [l.lower() for l in languages if l]
+
+    #--------------------------------------------------------------------------
+
+    def _try_start(self):
+        self._start_attempts -= 1
+
+        self.player.play()
+
+        # Give the last attempt as long as it needs.
+        if self._start_attempts > 0:
+            self._start_timer.start()
+
+    def _started(self):
+        self._start_attempts = 0
+        self._start_timer.stop()
+
+        # Only now are the media's tracks known, to show the window or not.
+        self._play.emit()
+
+        self._preload()
+        self._send_update()
+
+    def _advance(self):
+        """
+        Move on from media that has ended. If there is more in the queue, go
+        straight to it rather than stopping first, so that the window and
+        outputs stay up between the two.
+        """
+
+        if not self.playlist:
+            self.stop()
+
+            return
+
+        self._end_sync()
+        self._update_elapsed()
+
+        self.media_id = None
+
+        self.play()
+
+    def _new_media(self, item):
+        options = list(self.media_options)
+
+        # Have libVLC begin where we left off, rather than seeking once it is
+        # already playing.
+        #
+        if item[2]:
+            options.append(":start-time=%s" % item[2])
+
+        # Items queued before tracks were chosen have no options.
+        if len(item) > 4:
+            options.extend(item[4])
+
+        return self.instance.media_new(item[3], *options)
+
+    def _preload(self):
+        """
+        Create and parse the Media for the next item in the queue while the
+        current one plays, so that moving on to it waits on neither.
+        """
+
+        if not self.playlist:
+            self._discard_next()
+
+            return
+
+        item_id, item = self.playlist.first()
+
+        if self._next and self._next[0] == item_id:
+            return
+
+        self._discard_next()
+
+        self._next = (item_id, self._new_media(item))
+        self._next[1].parse_async()
+
+    def _discard_next(self):
+        """
+        Release the preloaded Media, which libVLC won't do by itself.
+        """
+
+        if self._next:
+            self._next[1].release()
+            self._next = None
+
+    def _retry_start(self):
+        """
+        Try starting again after an error or timeout. An error at any other
+        time ends the current media.
+        """
+
+        self._start_timer.stop()
+
+        if self._start_attempts > 0:
+            log.warn("Playback failed to start, retrying")
+
+            self._try_start()
+
+        elif self._get_state() == "error":
+            log.error("Playback failed")
+
+            self.stop()
+
+    def _start_at(self, at):
+        start = self.clock.to_local(at)
+        delay = int((start - time.time()) * 1000)
+
+        if delay < 0:
+            log.warn("Synchronised start is %sms late", -delay)
+
+        QtCore.QTimer.singleShot(max(delay, 0),
+                                 lambda: self._start_synchronised(start))
+
+    def _start_synchronised(self, start):
+        if not self.playlist:
+            return
+
+        elapsed = self.playlist.first()[1][2]
+
+        self.play()
+
+        self._sync_start = start - elapsed
+        self._drift_timer.start()
+
+    def _correct_drift(self):
+        """
+        Keep to the shared schedule. Small drift is made up by playing
+        slightly faster or slower until the next check, as that can't be
+        noticed, while anything large is corrected with a jump.
+        """
+
+        if self._get_state() != "playing":
+            return
+
+        expected = (time.time() - self._sync_start) * 1000
+        drift = self.player.get_time() - expected
+
+        log.info("Drift from synchronised schedule: %.0fms", drift)
+
+        rate = 1.0
+
+        if abs(drift) >= self.drift_jump:
+            self.player.set_time(int(expected))
+
+        elif drift > self.drift_tolerance:
+            rate = 1.0 - self.drift_rate
+
+        elif drift < -self.drift_tolerance:
+            rate = 1.0 + self.drift_rate
+
+        if rate != self.player.get_rate():
+            self.player.set_rate(rate)
+
+    def _jump(self, target):
+        """
+        Seek to the target once no other jump has followed for a moment.
+        """
+
+        self._seek_target = max(0, target)
+        self._seek_timer.start()
+
+    def _seek(self):
+        """
+        Seek to the time when the target is near. Further jumps go to the
+        position instead. With --input-fast-seek in the profile, that lands
+        on a nearby keyframe rather than the exact time. It saves decoding
+        everything in between, which is slow over a network.
+        """
+
+        if self._seek_target is None:
+            return
+
+        target, self._seek_target = self._seek_target, None
+        current = int(self.player.get_time())
+        length = int(self.player.get_length())
+
+        self._seek_from = current
+        self._seek_to = target
+        self._seek_issued = time.time()
+
+        if length > 0 and abs(target - current) >= self.seek_fast:
+            log.info("Fast seeking from %sms to %sms", current, target)
+
+            self.player.set_position(min(target, length) / float(length))
+
+        else:
+            self.player.set_time(target)
+
+    def _update_time(self, new_time, now):
+        """
+        Send an update when time has moved on, at most every interval,
+        unless a seek has just finished, which is sent straight away.
+        """
+
+        elapsed = new_time / 1000
+
+        if now - self._position_saved_at >= self.position_save:
+            self._position_saved_at = now
+            self.playlist.set_elapsed(elapsed)
+
+        # A seek is done once time is nearer its target than where it began.
+        if self._seek_issued is not None:
+            if (abs(new_time - self._seek_to) <
+                abs(new_time - self._seek_from)):
+                self._seek_latency = int((now - self._seek_issued) * 1000)
+                self._seek_issued = None
+                self._reported_elapsed = elapsed
+                self._reported_at = now
+
+                self._send_update()
+
+                return
+
+        if elapsed == self._reported_elapsed:
+            return
+
+        if now - self._reported_at < self.update_interval:
+            return
+
+        self._reported_elapsed = elapsed
+        self._reported_at = now
+
+        self._send_update()
+
+    def _get_seek_target(self):
+        if self._seek_target is not None:
+            return self._seek_target
+
+        return int(self.player.get_time())
+
+    def _end_sync(self):
+        if self._sync_start is None:
+            return
+
+        self._sync_start = None
+        self._drift_timer.stop()
+        self.player.set_rate(1.0)
+
+    #--------------------------------------------------------------------------
+
+    def _on_changed(self, event):
+        self._changed.emit()
+
+    def _on_time_changed(self, event):
+        # Taking the time here leaves the signal's queueing out of latency.
+        self._time_changed.emit(event.u.new_time, time.time())
+
+    def _on_playing(self, event):
+        self._playing.emit()
+
+    def _on_vout(self, event):
+        # Video output can start after playback, so check the window again.
+        self._play.emit()
+
+    def _on_ended(self, event):
+        self._ended.emit()
+
+    def _on_error(self, event):
+        self._failed.emit()
 
     #--------------------------------------------------------------------------
 
@@ -291,43 +854,96 @@ class Control(QtGui.QWidget):
 
     #--------------------------------------------------------------------------
 
-    def _call_api(self, bits):
-        """
-        Make a request to the Head's API.
-        """
-
-        url = "http://%s:%s/medusa/%s/%s" % (config.get("head", "host"),
-                                      config.get("ports", "head"),
-                                      config.get("head", "api_base"),
-                                      "/".join(str(b) for b in bits))
-
-        try:
-            return requests.get(url).json()
-
-        except Exception as excp:
-            log.error("API call to %s failed: %s", url, excp)
-
-            return {}
-
-    def _send_update(self):
+    def _get_status(self):
         elapsed, total = self._get_time()
 
-        update = {
+        return {
             "media_id": self.media_id or "",
             "name": self.media_name,
             "state": self._get_state(),
             "elapsed": elapsed,
             "total": total,
             "mute": int(self.player.audio_get_mute()) == 1,
-            "queue": self._queue,
+            "seek": self._seek_latency,
+            "disc": self.disc_monitor.disc[1] or "",
+            "queue": self.playlist.summary(),
             "audio": self.player.audio_get_track_description(),
             "subtitles": self.player.video_get_spu_description()
         }
 
-        self.communicate.send({"update": [self.name, update]})
+    def _get_media(self, media_id, callback):
+        """
+        Look up the details of a media item without blocking, asking the Head
+        over our existing connection and falling back to its API. The details
+        are passed to the callback on the Qt thread.
+        """
+
+        def fetched(data):
+            if not data:
+                log.error("Failed to get details of media %s", media_id)
+
+                return
+
+            callback(dict(data, id=media_id))
+
+        def requested(future):
+            if future.error:
+                log.error("Media request for %s failed: %s",
+                          media_id,
+                          future.error)
+
+                self.api.get(["media", media_id], fetched)
+
+            else:
+                self._resolved.emit(fetched, future.value)
+
+        request = self.communicate.request({"media": media_id})
+        request.add_done_callback(requested)
+
+    def _call_back(self, callback, argument):
+        callback(argument)
+
+    def _send_update(self):
+        """
+        Send the status fields that have changed since the last update. Each
+        update names the version it applies on top of, with 0 meaning that it
+        is a full status which replaces whatever the Head has.
+        """
+
+        status = self._get_status()
+        changes = {}
+
+        for key, value in status.items():
+            if self._status.get(key) != value:
+                changes[key] = value
+
+        if not changes:
+            return
+
+        since = self._status_version if self._status else 0
+        self._status_version += 1
+
+        message = [self.name, changes, since, self._status_version]
+
+        if self.communicate.send({"update": message}):
+            self._status = status
+
+        else:
+            # The Head may have missed this, so start afresh next time.
+            self._status = {}
+
+    def _report(self, message, bits):
+        """
+        Report viewing history to the Head over our connection, or through its
+        API if we are not connected.
+        """
+
+        if not self.communicate.send(message):
+            self.api.get(bits)
 
     def _insert_viewed(self, media_id):
-        self._call_api(["viewed", self.media_id])
+        self._report({"viewed": [self.media_id, False]},
+                     ["viewed", self.media_id])
 
     def _update_elapsed(self):
         if not self.media_id:
@@ -343,61 +959,31 @@ class Control(QtGui.QWidget):
             percentage = 0
 
         if percentage < threshold:
-            self._call_api(["viewed", self.media_id, "delete"])
+            self._report({"viewed": [self.media_id, True]},
+                         ["viewed", self.media_id, "delete"])
 
             return
 
         if (100 - percentage) < threshold:
             elapsed = 0
 
-        self._call_api(["elapsed", self.media_id, elapsed])
+        self._report({"elapsed": [self.media_id, elapsed]},
+                     ["elapsed", self.media_id, elapsed])
 
     #--------------------------------------------------------------------------
 
     def _build_media_path(self, path):
+        if isinstance(path, str):
+            path = path.decode(config.get("head", "encoding"))
+
         return unicode(os.path.join(self.media_path, path))
 
     def _build_downloads_path(self, name):
-        for root, directories, files in os.walk(self.downloads_path):
-            for file_ in files:
-                if name == file_:
-                    return unicode(os.path.join(root, file_))
+        return DownloadsIndex(self.downloads_path).find(name)
 
     def _build_disc_path(self):
         """
-        Find the path to an inserted disc, if any.
+        Get the path to and name of an inserted disc, if any.
         """
 
-        path = None
-        name = None
-
-        check = glob.glob("/media/*/VIDEO_TS")
-        name_level = 2
-
-        if not check:
-            check = glob.glob("/media/*/*/VIDEO_TS")
-            name_level = 3
-
-        if check:
-            path = "dvd:///dev/sr0"
-            name = "DVD"
-
-        else:
-            check = glob.glob("/media/*/BDMV")
-            name_level = 2
-
-            if not check:
-                check = glob.glob("/media/*/*/BDMV")
-                name_level = 3
-
-            if check:
-                path = "bluray:///dev/sr0"
-                name = "Blu-ray"
-
-        try:
-            name = check[0].split("/")[name_level].replace("_", " ").title()
-
-        except Exception:
-            pass
-
-        return path, name
+        return self.disc_monitor.disc
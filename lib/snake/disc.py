@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+Keep track of whether a DVD or Blu-ray disc is mounted, so that playing one
+doesn't mean searching for it each time.
+"""
+
+import glob
+import os
+import select
+import threading
+import time
+
+from lib.medusa import utilities
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+MEDIA_PATH = "/media"
+MOUNTS_PATH = "/proc/self/mounts"
+
+# The directory found at the root of each kind of disc, and how to play it.
+DISCS = [
+    ("VIDEO_TS", "dvd", "DVD"),
+    ("BDMV", "bluray", "Blu-ray")
+]
+
+#------------------------------------------------------------------------------
+
+class DiscMonitor(object):
+    """
+    Linux signals a change to the mount table through poll on its mounts
+    file, which is when a disc could have come or gone, so the mount points
+    are only checked then. Each callback is called with the disc's path and
+    name, or None and None, whenever that changes.
+
+    Elsewhere, the mount points are checked every so often instead.
+    """
+
+    __metaclass__ = utilities.Singleton
+
+    def __init__(self):
+        self.callbacks = []
+        self.interval = config.getint("snake", "disc_interval")
+        self.disc = self._find()
+
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    #--------------------------------------------------------------------------
+
+    def _run(self):
+        mounts = None
+
+        try:
+            mounts = open(MOUNTS_PATH)
+            poller = select.poll()
+            poller.register(mounts, select.POLLERR | select.POLLPRI)
+
+        except (IOError, AttributeError):
+            log.warn("Mount changes unavailable, checking for discs every "
+                     "%ss", self.interval)
+
+        while True:
+            if mounts:
+                # Reading the mounts again is what clears the change.
+                if poller.poll():
+                    mounts.seek(0)
+                    mounts.read()
+
+            else:
+                time.sleep(self.interval)
+
+            self._refresh()
+
+    def _refresh(self):
+        disc = self._find()
+
+        if disc == self.disc:
+            return
+
+        self.disc = disc
+
+        log.warn("Disc changed: %s", disc[1])
+
+        for callback in self.callbacks:
+            callback(*disc)
+
+    def _find(self):
+        for mount, device in self._get_mounts():
+            for directory, scheme, name in DISCS:
+                if not os.path.isdir(os.path.join(mount, directory)):
+                    continue
+
+                label = os.path.basename(mount).replace("_", " ").title()
+
+                return "%s://%s" % (scheme, device), label or name
+
+        return None, None
+
+    def _get_mounts(self):
+        """
+        Get the mount points under the media directory and their devices.
+        """
+
+        try:
+            with open(MOUNTS_PATH) as file_:
+                lines = file_.readlines()
+
+        except IOError:
+            paths = (glob.glob("%s/*" % MEDIA_PATH) +
+                     glob.glob("%s/*/*" % MEDIA_PATH))
+
+            return [(path, "/dev/sr0") for path in paths]
+
+        mounts = []
+
+        for line in lines:
+            fields = line.split()
+
+            if len(fields) < 2:
+                continue
+
+            # Spaces and the like are escaped as octal, e.g. "\040".
+            device, mount = [f.decode("string_escape") for f in fields[:2]]
+
+            if mount.startswith("%s/" % MEDIA_PATH):
+                mounts.append((mount, device))
+
+        return mounts
@@ -6,21 +6,21 @@ Control the Qt interface that contains the VLC player.
 
 import sys
 
-from PyQt4 import QtCore
-from PyQt4 import QtGui
-
-from lib.medusa.config import config
+from PyQt4 import QtCore, QtGui
 
 #------------------------------------------------------------------------------
 
 class Interface(QtGui.QMainWindow):
 
-    def __init__(self, control):
+    def __init__(self, control, screen=None):
         super(Interface, self).__init__()
 
         self.control = control
         self.player = self.control.player
 
+        # The screen to play on, by number, or the primary one if None.
+        self.screen = screen
+
     #--------------------------------------------------------------------------
 
     def initialise(self):
@@ -34,12 +34,14 @@ class Interface(QtGui.QMainWindow):
         self.window = QtGui.QWidget(self)
         self.setCentralWidget(self.window)
 
-        # Center the window.
+        # Center the window, on its screen if it has one, which is also where
+        # it will go full screen.
         #
         self.setWindowTitle("Medusa")
         self.resize(1280, 720)
         geometry = self.frameGeometry()
-        center = QtGui.QDesktopWidget().availableGeometry().center()
+        desktop = QtGui.QDesktopWidget()
+        center = desktop.availableGeometry(self._get_screen(desktop)).center()
         geometry.moveCenter(center)
         self.move(geometry.topLeft())
 
@@ -50,12 +52,6 @@ class Interface(QtGui.QMainWindow):
         self.window.setPalette(palette)
         self.window.setAutoFillBackground(True)
 
-        # Set up a timer that will update playback status to the Head.
-        #
-        self.timer = QtCore.QTimer(self)
-        self.timer.setInterval(config.getint("snake", "update"))
-        self.timer.timeout.connect(self.check_status)
-
     def connect_player(self):
         if sys.platform == "win32":
             self.player.set_hwnd(self.window.winId())
@@ -67,28 +63,28 @@ class Interface(QtGui.QMainWindow):
             self.player.set_xwindow(self.window.winId())
 
     def connect_slots(self):
-        self.control._play.connect(self.play)
+        # Played is signalled from libVLC's threads as well as the Qt thread.
+        self.control._play.connect(self.play, QtCore.Qt.QueuedConnection)
         self.control._stop.connect(self.stop)
 
-    #--------------------------------------------------------------------------
+    def _get_screen(self, desktop):
+        if self.screen is None or self.screen >= desktop.screenCount():
+            return desktop.primaryScreen()
 
-    def check_status(self):
-        """
-        Check that VLC is still playing. If it isn't, trigger a stop.
-        """
+        return self.screen
 
-        if self.control.state() not in ("playing", "paused"):
-            self.control.stop()
+    #--------------------------------------------------------------------------
 
     def play(self):
-        # Only show the window if there is a video track.
+        # Only show the window if there is a video track, hiding it when
+        # moving on from a video to something without one.
         #
         if self.control.player.video_get_track_count() > 0:
             self.show()
             self.showFullScreen()
 
-        self.timer.start()
+        else:
+            self.hide()
 
     def stop(self):
-        self.timer.stop()
         self.hide()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Hold the queue of media items waiting to be played by a Snake.
+"""
+
+import collections
+import itertools
+import json
+import os
+
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class Playlist(object):
+    """
+    Items are kept in order along with an ID, which stays the same while
+    other items come and go, so that the Head can refer to them.
+
+    Once loaded for a Snake, the queue is saved after every change, along with
+    whatever is playing, so that it survives the Snake restarting.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.current = None
+
+        self._entries = collections.deque()
+        self._counter = itertools.count(1)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return (item for item_id, item in self._entries)
+
+    def load(self, name):
+        """
+        Restore the queue saved for the named Snake, putting anything that
+        was playing back at the front.
+        """
+
+        directory = os.path.join(config.base_path,
+                                 config.get("files", "queues"))
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = os.path.join(directory, "%s.json" % name)
+
+        try:
+            with open(self.path) as file_:
+                data = json.load(file_)
+
+        except IOError:
+            return
+
+        except ValueError as excp:
+            log.error("Failed to load queue: %s", excp)
+
+            return
+
+        entries = data.get("entries", [])
+
+        if data.get("current"):
+            entries.insert(0, data["current"])
+
+        self._entries = collections.deque((i, tuple(e)) for i, e in entries)
+        self._counter = itertools.count(max([0] + [i for i, e in entries]) + 1)
+
+        log.warn("Restored %s queued items", len(self._entries))
+
+    def append(self, item):
+        return self.insert(len(self._entries), item)
+
+    def insert(self, position, item):
+        return self.extend([item], position)[0]
+
+    def extend(self, items, position=None):
+        """
+        Queue several items together, saving only once, at the end unless a
+        position is given. Returns their IDs.
+        """
+
+        if position is None:
+            position = len(self._entries)
+
+        item_ids = []
+
+        for offset, item in enumerate(items):
+            item_id = next(self._counter)
+
+            self._insert(position + offset, (item_id, item))
+            item_ids.append(item_id)
+
+        self._save()
+
+        return item_ids
+
+    def first(self):
+        """
+        Get the ID and item at the front of the queue, if any.
+        """
+
+        if self._entries:
+            return self._entries[0]
+
+    def pop(self):
+        """
+        Take the ID and item from the front of the queue, as it starts to
+        play.
+        """
+
+        self.current = self._entries.popleft()
+        self._save()
+
+        return self.current
+
+    def set_elapsed(self, elapsed):
+        """
+        Save how far into the current item playback has got, so that it
+        resumes from there once restored.
+        """
+
+        if not self.current:
+            return
+
+        item_id, item = self.current
+
+        self.current = (item_id, item[:2] + (elapsed,) + item[3:])
+        self._save()
+
+    def finish(self):
+        self.current = None
+        self._save()
+
+    def remove(self, item_id):
+        index = self._index(item_id)
+
+        if index is not None:
+            del self._entries[index]
+            self._save()
+
+    def move(self, item_id, position):
+        index = self._index(item_id)
+
+        if index is not None:
+            entry = self._entries[index]
+
+            del self._entries[index]
+
+            self._insert(position, entry)
+            self._save()
+
+    def clear(self):
+        self._entries.clear()
+        self._save()
+
+    def summary(self):
+        """
+        Get the ID, media ID and name of each item, which is all the Head
+        needs to show and refer to them.
+        """
+
+        return [[i, item[0], item[1]] for i, item in self._entries]
+
+    #--------------------------------------------------------------------------
+
+    def _insert(self, position, entry):
+        # Python 2's deque has no insert, but it can be rotated cheaply.
+        position = max(0, min(position, len(self._entries)))
+
+        self._entries.rotate(-position)
+        self._entries.appendleft(entry)
+        self._entries.rotate(position)
+
+    def _index(self, item_id):
+        for index, entry in enumerate(self._entries):
+            if entry[0] == int(item_id):
+                return index
+
+        log.warn("No queued item with ID: %s", item_id)
+
+    def _save(self):
+        if not self.path:
+            return
+
+        data = {"current": self.current, "entries": list(self._entries)}
+        temporary = "%s.tmp" % self.path
+
+        # Write then rename, so that a crash can't leave half a file.
+        try:
+            with open(temporary, "w") as file_:
+                json.dump(data, file_)
+
+            os.rename(temporary, self.path)
+
+        except (IOError, OSError) as excp:
+            log.error("Failed to save queue: %s", excp)
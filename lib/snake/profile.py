@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""
+Read the named libVLC profiles, which tune playback to the machine a Snake
+runs on and where its media is kept.
+"""
+
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+PREFIX = "profile "
+
+#------------------------------------------------------------------------------
+
+def get_names():
+    return [s[len(PREFIX):] for s in config.sections() if s.startswith(PREFIX)]
+
+def get_instance_arguments(name):
+    """
+    Get the arguments to create a libVLC Instance with, which apply to
+    everything it plays.
+    """
+
+    return _get_values(name, "instance")
+
+def get_media_options(name):
+    """
+    Get the options to add to each Media, which apply only to that media.
+    """
+
+    return _get_values(name, "media")
+
+#------------------------------------------------------------------------------
+
+def _get_values(name, option):
+    section = "%s%s" % (PREFIX, name)
+
+    if not config.has_section(section):
+        log.error("No such libVLC profile: %s", name)
+
+        return []
+
+    if not config.has_option(section, option):
+        return []
+
+    return [v for v in config.getlist(section, option) if v]
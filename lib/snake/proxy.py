@@ -4,9 +4,7 @@
 Proxy function calls exposed to the Head during communication.
 """
 
-import traceback
-
-from lib.medusa.log import log
+from lib.medusa.communicate import Future
 
 #------------------------------------------------------------------------------
 
@@ -14,18 +12,20 @@ class Proxy(object):
 
     control = None
 
+    def __init__(self, control=None):
+        # A host of several Snakes gives each of their proxies its Control.
+        if control:
+            self.control = control
+
     def action(self, message):
         """
-        Try to perform the received playback action on the Control object.
+        Hand the received playback action to the Control object, which will
+        perform it on the Qt thread. The returned Future completes once it
+        has, so that a request for the action is answered only then.
         """
 
-        try:
-            function, arguments = message
-
-            getattr(self.control, function)(*arguments)
+        future = Future()
 
-            log.warn("Performed action: %s", function)
+        self.control._action.emit(message, future)
 
-        except Exception as excp:
-            log.error("Action %s failed: %s", function, excp)
-            log.error(traceback.format_exc())
+        return future
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Keep track of the Head's clock, so that Snakes can start playback together.
+"""
+
+import threading
+import time
+
+from lib.medusa.config import config
+from lib.medusa.log import log
+
+#------------------------------------------------------------------------------
+
+class ClockSync(object):
+    """
+    Estimate the offset between our clock and the Head's, in the same way as
+    NTP. Each sample asks the Head for its time and assumes it was read
+    halfway through the round trip. Of several samples, the one with the
+    shortest round trip had the least room for error, so its offset is used.
+
+    Samples are taken one after another from the communication thread, and
+    never block it.
+    """
+
+    def __init__(self, communicate, clock=time.time):
+        self.communicate = communicate
+        self.clock = clock
+        self.samples = config.getint("sync", "clock_samples")
+        self.interval = config.getint("sync", "clock_interval")
+
+        # The Head's time minus ours, and the round trip it was measured over.
+        self.offset = 0.0
+        self.delay = None
+
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Measure the offset now and then periodically, as clocks drift apart.
+        """
+
+        self.measure()
+
+        self.communicate.thread.loop.call_later(self.interval, self.start)
+
+    def measure(self, callback=None):
+        """
+        Take a fresh set of samples. If given, callback is called with the
+        new offset once they have been taken, on the communication thread.
+        """
+
+        with self._lock:
+            measuring = bool(self._callbacks)
+
+            self._callbacks.append(callback)
+
+        # Share the measurement already under way.
+        if not measuring:
+            self._sample([])
+
+    def to_local(self, head_time):
+        return head_time - self.offset
+
+    def to_head(self, local_time):
+        return local_time + self.offset
+
+    #--------------------------------------------------------------------------
+
+    def _sample(self, samples):
+        sent = self.clock()
+
+        def received(future):
+            now = self.clock()
+
+            if future.error:
+                log.warn("Clock sample failed: %s", future.error)
+
+                self._finish(samples)
+
+                return
+
+            samples.append((now - sent, future.value - (sent + now) / 2.0))
+
+            if len(samples) < self.samples:
+                self._sample(samples)
+
+            else:
+                self._finish(samples)
+
+        request = self.communicate.request({"clock": None})
+        request.add_done_callback(received)
+
+    def _finish(self, samples):
+        if samples:
+            self.delay, self.offset = min(samples)
+
+            log.info("Clock offset to Head: %.1fms (round trip %.1fms)",
+                     self.offset * 1000,
+                     self.delay * 1000)
+
+        else:
+            log.error("Failed to measure clock offset, keeping %.1fms",
+                      self.offset * 1000)
+
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            if callback:
+                callback(self.offset)
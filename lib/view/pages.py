@@ -5,6 +5,7 @@ The Medusa web interface page routes.
 """
 
 from collections import OrderedDict
+import os
 
 import flask
 
@@ -31,11 +32,13 @@ def index():
 def browse():
     categories = config.getlist("browse", "categories")
     continue_ = retrieve.get_continue_media()
+    discs = retrieve.get_discs()
 
     return flask.render_template("browse.html",
                                  page="browse",
                                  categories=categories,
-                                 continue_=continue_)
+                                 continue_=continue_,
+                                 discs=discs)
 
 @pages.route("/browse/film")
 def browse_film():
@@ -175,6 +178,8 @@ def media(media_id):
             item["episode"] = str(item["name_three"]).zfill(2)
             item["previous"], item["next"] = retrieve.get_nearby_episodes(media_id)
 
+        item["runtime"] = retrieve.get_runtime(item.get("duration"))
+
         data = database.select_viewed(media_id)
 
         if data:
@@ -198,6 +203,20 @@ def media_new(name):
                                  page="media",
                                  item=item)
 
+@pages.route("/thumbnail/<name>")
+def thumbnail(name):
+    """
+    Thumbnails are named by their contents, so never change once served.
+    """
+
+    path = os.path.join(config.base_path, config.get("files", "thumbnails"))
+    response = flask.send_from_directory(path, name, mimetype="image/jpeg")
+
+    response.cache_control.public = True
+    response.cache_control.max_age = config.getint("thumbnails", "max_age")
+
+    return response
+
 @pages.route("/new")
 def new():
     items = retrieve.get_new_items()
@@ -12,6 +12,7 @@ from lib.head.database import Database
 from lib.head.proxy import Proxy
 from lib.medusa import categories
 from lib.medusa.config import config
+from lib.medusa.downloads import DownloadsIndex
 
 #------------------------------------------------------------------------------
 
@@ -22,13 +23,11 @@ def get_new_items():
     items = OrderedDict()
     files = []
 
-    for root, directories, files_ in os.walk(unicode(path)):
-        for f in files_:
-            extension = os.path.splitext(f)[-1].lstrip(".")
+    for modified, f, _ in DownloadsIndex(path).files():
+        extension = os.path.splitext(f)[-1].lstrip(".")
 
-            if extension in video_formats:
-                modified = os.path.getmtime(os.path.join(root, f))
-                files.append((modified, f, None))
+        if extension in video_formats:
+            files.append((modified, f, None))
 
     for item in Database().select_new():
         files.append((item["modified"],
@@ -72,6 +71,17 @@ def get_viewed_date(time):
 
     return datetime.datetime.fromtimestamp(int(time)).strftime("%B %d, %Y")
 
+def get_runtime(duration):
+    if not duration:
+        return
+
+    hours, minutes = divmod(int(duration) // 60, 60)
+
+    if hours:
+        return "%sh %sm" % (hours, minutes)
+
+    return "%sm" % max(minutes, 1)
+
 def get_nearby_episodes(media_id):
     episodes = Database().select_category("television")
 
@@ -90,13 +100,20 @@ def get_nearby_episodes(media_id):
     return previous, next
 
 def get_playing_snakes():
-    snakes = Proxy._snakes
+    snakes = []
+
+    for k, v in Proxy._snakes.items():
+        if v.get("media_id"):
+            snakes.append(k)
+
+    return snakes
 
-    for k, v in snakes.items():
-        if not v.get("media_id"):
-            snakes.pop(k, None)
+def get_discs():
+    """
+    Get the names of the discs inserted in Snakes, as they report them.
+    """
 
-    return snakes.keys()
+    return [v["disc"] for v in Proxy._snakes.values() if v.get("disc")]
 
 def get_continue_media():
     database = Database()
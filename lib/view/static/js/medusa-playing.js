@@ -27,7 +27,10 @@ var Playing = function() {
     var mediaId;
     var pathname = window.location.pathname;
     var retries = 0;
+    var retryTimer;
     var snakeName = Utilities.getURLBits()[3];
+    var status = {};
+    var stream;
     var subtitleTracks;
     var timeTotal;
     var updateInterval = 5000;
@@ -51,65 +54,78 @@ var Playing = function() {
     // --------------------------------------------------------------------- //
 
     var updateMedia = function(initialLoad) {
+        // When streaming, the latest status is already held locally.
+        if (stream) {
+            renderStatus(status, initialLoad);
+            return;
+        }
+
         $.get(shared.api + "/status/" + snakeName, function(data) {
-            var state = data["state"];
-            var timeElapsed = data["elapsed"];
-            timeTotal = data["total"];
+            renderStatus(data, initialLoad);
+        });
+    };
 
-            var buttonPause = "div.buttonPause";
+    var renderStatus = function(data, initialLoad) {
+        var state = data["state"];
+        var timeElapsed = data["elapsed"];
+        timeTotal = data["total"];
 
-            if (state === "paused") {
-                $(buttonPause).text("Resume");
-            }
-            else {
-                $(buttonPause).text("Pause");
-            }
+        var buttonPause = "div.buttonPause";
 
-            var buttonMute = "div.buttonMute";
+        if (state === "paused") {
+            $(buttonPause).text("Resume");
+        }
+        else {
+            $(buttonPause).text("Pause");
+        }
 
-            if (data["mute"]) {
-                $(buttonMute).text("Unmute");
-            }
-            else {
-                $(buttonMute).text("Mute");
-            }
+        var buttonMute = "div.buttonMute";
 
-            if ((state === "opped") ||
-                (state === "ended") ||
-                (state === "nothingspecial") ||
-                ((timeElapsed > 0) && (timeElapsed == timeTotal))) {
-                if ((initialLoad) || (retries < maxRetries)) {
-                    retries += 1;
-                    setTimeout(updateMedia, 500);
-                    return;
-                }
+        if (data["mute"]) {
+            $(buttonMute).text("Unmute");
+        }
+        else {
+            $(buttonMute).text("Mute");
+        }
 
-                window.location = "/medusa";
+        if ((state === "opped") ||
+            (state === "ended") ||
+            (state === "nothingspecial") ||
+            ((timeElapsed > 0) && (timeElapsed == timeTotal))) {
+            if ((initialLoad) || (retries < maxRetries)) {
+                retries += 1;
+
+                // Streamed events may arrive before the last retry is due.
+                clearTimeout(retryTimer);
+                retryTimer = setTimeout(updateMedia, 500);
+                return;
             }
 
-            if (data["media_id"] != mediaId) {
-                mediaId = data["media_id"];
-                audioTracks = data["audio"];
-                subtitleTracks = data["subtitles"];
+            window.location = "/medusa";
+        }
 
-                if (isNaN(mediaId)) {
-                    updateTextAlternative(data);
-                }
-                else {
-                    $.get(shared.api + "/media/" + mediaId, function(data) {
-                        updateTextBasic(data);
-                    });
-                }
+        if (data["media_id"] != mediaId) {
+            mediaId = data["media_id"];
+            audioTracks = data["audio"];
+            subtitleTracks = data["subtitles"];
+
+            if (isNaN(mediaId)) {
+                updateTextAlternative(data);
             }
+            else {
+                $.get(shared.api + "/media/" + mediaId, function(data) {
+                    updateTextBasic(data);
+                });
+            }
+        }
 
-            moveProgressBar(timeElapsed / timeTotal);
-            var elapsed = Utilities.formatTime(timeElapsed);
-            var total = Utilities.formatTime(timeTotal);
+        moveProgressBar(timeElapsed / timeTotal);
+        var elapsed = Utilities.formatTime(timeElapsed);
+        var total = Utilities.formatTime(timeTotal);
 
-            if (elapsed != "aN:aN") {
-                $(elements.progressBarText).html(elapsed + " / " + total);
-            }
-        });
+        if (elapsed != "aN:aN") {
+            $(elements.progressBarText).html(elapsed + " / " + total);
+        }
     };
 
     // --------------------------------------------------------------------- //
@@ -466,6 +482,21 @@ var Playing = function() {
         // ----------------------------------------------------------------- //
 
         beginUpdating: function() {
+            // Prefer having status changes pushed to us over polling.
+            if (window.EventSource) {
+                var initialLoad = true;
+
+                stream = new EventSource(shared.api + "/stream/" + snakeName);
+
+                stream.onmessage = function(event_) {
+                    $.extend(status, JSON.parse(event_.data));
+                    renderStatus(status, initialLoad);
+                    initialLoad = false;
+                };
+
+                return;
+            }
+
             updateMedia(true);
 
             setTimeout(updateMedia, 2000);
@@ -2,9 +2,13 @@
 
 """
 A Snake is a media player. It receives instructions from Medusa's Head.
+
+Several Snakes can be run in one process, e.g. one per screen of the same
+machine. They then share a libVLC instance and a connection to the Head.
 """
 
 import argparse
+import functools
 import sys
 
 from PyQt4 import QtGui
@@ -14,27 +18,66 @@ from lib.medusa.log import log
 from lib.snake.control import Control
 from lib.snake.interface import Interface
 from lib.snake.proxy import Proxy
+from lib.snake.sync import ClockSync
 
 #------------------------------------------------------------------------------
 
 def main(options):
     application = QtGui.QApplication(sys.argv)
 
-    control = Control()
-    control.name = options.name
-    control.media_path = options.media
-    control.downloads_path = options.downloads
+    controls = []
+    proxies = {}
+    instance = None
+
+    for name in options.name:
+        # Any further Snakes share the first's libVLC instance.
+        control = Control(instance)
+        control.name = name
+        control.media_path = options.media
+        control.downloads_path = options.downloads
+        control.playlist.load(name)
+
+        instance = control.instance
+
+        controls.append(control)
+        proxies[name] = functools.partial(Proxy, control)
+
+    # Several Snakes share one connection, with messages routed by name.
+    if len(controls) > 1:
+        communicate = Communicate(proxy=proxies,
+                                  name=options.name,
+                                  qthread=True)
+
+    else:
+        communicate = Communicate(proxy=proxies[options.name[0]],
+                                  name=options.name[0],
+                                  qthread=True)
+
+    # The Snakes share a clock too, so its offset need only be measured once.
+    clock = ClockSync(communicate)
+    clock.start()
+
+    interfaces = []
+
+    for index, control in enumerate(controls):
+        control.communicate = communicate
+        control.clock = clock
 
-    Proxy.control = control
+        # Each Snake plays on a screen of its own, unless told otherwise.
+        if options.screens:
+            screen = options.screens[index % len(options.screens)]
 
-    communicate = Communicate(proxy=Proxy, name=options.name, qthread=True)
+        elif len(controls) > 1:
+            screen = index
 
-    control.communicate = communicate
+        else:
+            screen = None
 
-    interface = Interface(control)
-    interface.initialise()
+        interface = Interface(control, screen)
+        interface.initialise()
+        interfaces.append(interface)
 
-    control._send_update()
+        control._send_update()
 
     application.exec_()
 
@@ -44,11 +87,13 @@ def parse_arguments():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-n", "--name",
-                        action="store", required=True)
+                        action="store", nargs="+", required=True)
     parser.add_argument("-m", "--media",
                         action="store", type=unicode, required=True)
     parser.add_argument("-d", "--downloads",
                         action="store", type=unicode)
+    parser.add_argument("-s", "--screens",
+                        action="store", type=int, nargs="+")
 
     return parser.parse_args()
 